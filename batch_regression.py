@@ -0,0 +1,213 @@
+import numpy as np
+import pandas as pd
+from scipy import stats
+from model_functions import build_position_dic
+
+# batched replacement for running statsmodels OLS once per season and position:
+# every design matrix is reduced to its Gram matrix X'X and X'y, and all of them
+# are solved together with numpy's stacked linear algebra
+
+class OLSResult:
+    """
+    Summary:
+        the parts of a statsmodels OLS result used by generate_params_df and the valuation code
+
+    Attributes:
+        params (Series): coefficients indexed by regressor ('const' first when there is an intercept)
+        bse (Series): standard errors
+        pvalues (Series): two-sided t-test p-values
+        nobs (int): observations used
+        df_resid (int): residual degrees of freedom
+        ssr (float): sum of squared residuals
+    """
+    def __init__(self, params, bse, pvalues, nobs, df_resid, ssr):
+        self.params = params
+        self.bse = bse
+        self.pvalues = pvalues
+        self.nobs = nobs
+        self.df_resid = df_resid
+        self.ssr = ssr
+
+def filter_rows(df, y, x, minute_filter = 0):
+    """
+    Summary:
+        the rows build_model.run_regression keeps: trailing minutes above the filter and no missing y or x
+    """
+    if 'tr_minutes' in df.columns:
+        df = df[df['tr_minutes'] > minute_filter]
+    return df.dropna(subset = [y] + x)
+
+def design_matrix(df, y, x, intercept = True, minute_filter = 0):
+    """
+    Summary:
+        filters df and builds (y, X, regressor names) exactly as build_model.run_regression does before fitting
+    """
+    if type(x) == str:
+        x = [x]
+    df = filter_rows(df, y, x, minute_filter)
+    y_data = df[y].to_numpy(dtype = float)
+    x_data = df[x].to_numpy(dtype = float)
+    names = list(x)
+    if intercept:
+        x_data = np.column_stack([np.ones(len(df)), x_data])
+        names = ['const'] + names
+    return y_data, x_data, names
+
+def solve_grams(xtx, xty):
+    """
+    Summary:
+        solves a stack of normal equations X'X b = X'y
+
+    Args:
+        xtx (array): (g, k, k) Gram matrices X'X
+        xty (array): (g, k) X'y
+
+    Returns:
+        tuple: pseudo-inverses of X'X (g, k, k), coefficients (g, k)
+    """
+    inv = np.linalg.pinv(xtx)
+    beta = np.einsum('gij,gj->gi', inv, xty)
+    return inv, beta
+
+def coefficient_stats(inv, beta, ssr, df_resid):
+    """
+    Summary:
+        standard errors and two-sided p-values for a stack of fitted coefficients, as statsmodels computes them
+    """
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        sigma2 = ssr / df_resid
+        bse = np.sqrt(sigma2[:, None] * np.diagonal(inv, axis1 = 1, axis2 = 2))
+        tvalues = beta / bse
+    pvalues = 2 * stats.t.sf(np.abs(tvalues), df_resid[:, None])
+    return bse, pvalues
+
+def gram_ssr(xtx, xty, yty, beta):
+    """
+    Summary:
+        residual sum of squares y'y - 2b'X'y + b'X'Xb from the Gram matrices alone
+    """
+    ssr = yty - 2 * np.einsum('gi,gi->g', beta, xty) + np.einsum('gi,gij,gj->g', beta, xtx, beta)
+    return np.maximum(ssr, 0)
+
+def fit_stacked(designs):
+    """
+    Summary:
+        fits OLS for a dictionary of designs in one batched solve
+
+    Args:
+        designs (dic): {key: (y, X, names)} as returned by design_matrix, all with the same regressors
+
+    Returns:
+        dic: {key: OLSResult}
+    """
+    keys = list(designs.keys())
+    if len(keys) == 0:
+        return {}
+    names = designs[keys[0]][2]
+    y_all = np.concatenate([designs[key][0] for key in keys])
+    x_all = np.concatenate([designs[key][1] for key in keys])
+    nobs = np.array([len(designs[key][0]) for key in keys])
+    group = np.repeat(np.arange(len(keys)), nobs)
+    k = x_all.shape[1]
+
+    xtx = np.zeros((len(keys), k, k))
+    np.add.at(xtx, group, np.einsum('ni,nj->nij', x_all, x_all))
+    xty = np.zeros((len(keys), k))
+    np.add.at(xty, group, x_all * y_all[:, None])
+
+    inv, beta = solve_grams(xtx, xty)
+    residuals = y_all - np.einsum('ni,ni->n', x_all, beta[group])
+    ssr = np.bincount(group, weights = residuals ** 2, minlength = len(keys))
+    df_resid = nobs - np.linalg.matrix_rank(xtx)
+    bse, pvalues = coefficient_stats(inv, beta, ssr, df_resid)
+
+    return {
+        key: OLSResult(
+            pd.Series(beta[i], index = names),
+            pd.Series(bse[i], index = names),
+            pd.Series(pvalues[i], index = names),
+            int(nobs[i]),
+            int(df_resid[i]),
+            float(ssr[i]),
+            )
+        for i, key in enumerate(keys)
+        }
+
+def build_model_dics(positions, data_dic, params, intercept = True, minute_filter = 80):
+    """
+    Summary:
+        batched build_model.build_model_dic for several positions at once
+        all position x season regressions are stacked and solved in a single pass
+
+    Args:
+        positions (lst): positions from ['GK', 'DEF', 'FWD', 'MID']
+        data_dic (dic): dictionary of {season: data_df}
+        params (lst): [y, x1, x2, ... xn]
+        intercept (bool): add a constant regressor
+        minute_filter (int): to exclude players with trailing ave mpg below given threshold
+
+    Returns:
+        dic: {position: {season: OLSResult}}, each inner dictionary can go straight to generate_params_df
+    """
+    designs = {}
+    for position in positions:
+        position_dic = build_position_dic(data_dic, position)
+        for season in data_dic.keys():
+            designs[(position, season)] = design_matrix(position_dic[season], params[0], params[1:], intercept, minute_filter)
+
+    results = fit_stacked(designs)
+    return {position: {season: results[(position, season)] for season in data_dic.keys()} for position in positions}
+
+def gw_order(gw_labels):
+    """
+    Summary:
+        sortable (season start year, gameweek) pairs from 'YYYY-YY-N' gw labels
+    """
+    parts = pd.Series(gw_labels).str.split('-')
+    return list(zip(parts.str[0].astype(int), parts.str[-1].astype(int)))
+
+def rolling_origin_fit(df, params, intercept = True, minute_filter = 80, window = None):
+    """
+    Summary:
+        refits the regression at every gameweek origin using only the data up to and including that gameweek
+        per-gameweek Gram matrices are summed cumulatively, so each refit is a k x k solve rather than a pass over the data
+
+    Args:
+        df (df): model data for one position, across as many seasons as required, with a 'gw' label column
+        params (lst): [y, x1, x2, ... xn]
+        intercept (bool): add a constant regressor
+        minute_filter (int): to exclude players with trailing ave mpg below given threshold
+        window (int, optional): only use the last `window` gameweeks at each origin, defaults to all prior data
+
+    Returns:
+        df: in the generate_params_df layout, with one column per origin gameweek
+    """
+    labels = list(df['gw'].unique())
+    labels = [label for _, label in sorted(zip(gw_order(labels), labels))]
+    df = filter_rows(df, params[0], params[1:], minute_filter)
+    y_data, x_data, names = design_matrix(df, params[0], params[1:], intercept, minute_filter)
+    position = df['gw'].map({label: i for i, label in enumerate(labels)}).to_numpy()
+
+    t = len(labels)
+    k = x_data.shape[1]
+    xtx = np.zeros((t, k, k))
+    np.add.at(xtx, position, np.einsum('ni,nj->nij', x_data, x_data))
+    xty = np.zeros((t, k))
+    np.add.at(xty, position, x_data * y_data[:, None])
+    yty = np.bincount(position, weights = y_data ** 2, minlength = t)
+    nobs = np.bincount(position, minlength = t)
+
+    xtx, xty, yty, nobs = [np.cumsum(a, axis = 0) for a in [xtx, xty, yty, nobs]]
+    if window != None:
+        xtx[window:] = xtx[window:] - xtx[:-window]
+        xty[window:] = xty[window:] - xty[:-window]
+        yty[window:] = yty[window:] - yty[:-window]
+        nobs[window:] = nobs[window:] - nobs[:-window]
+
+    inv, beta = solve_grams(xtx, xty)
+    ssr = gram_ssr(xtx, xty, yty, beta)
+    df_resid = nobs - np.linalg.matrix_rank(xtx)
+    bse, pvalues = coefficient_stats(inv, beta, ssr, df_resid)
+
+    frames = [pd.DataFrame(a.T, index = names, columns = labels) for a in [beta, bse, pvalues]]
+    return pd.concat(frames, keys = ['Coefficients', 'Std Errors', 'p-vals'])
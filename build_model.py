@@ -4,6 +4,8 @@ import pandas as pd
 import statsmodels.api as sm
 from pandas.plotting import autocorrelation_plot
 from model_dataset_functions import get_prev_season
+from storage import read_table
+from valuation import PlayerValuer
 
 # the folowing functions help build datasets by season and position 
 # which can then be used to build regression models on
@@ -151,7 +153,7 @@ end = folders.index('2024-25')
 
 seasons = folders[start:end]
 filepaths = [f'{path}{season}/model_data.csv' for season in seasons]
-dfs = [pd.read_csv(filepath, index_col=0) for filepath in filepaths]
+dfs = [read_table(filepath, index_col=0) for filepath in filepaths]
 
 season_data_dic = dict(zip(seasons, dfs))
 
@@ -162,35 +164,14 @@ gk_params = ['tr_total_points', 'tr_clean_sheets', 'tr_goals_conceded', 'tr_infl
 gk_model = build_model_dic('GK', season_data_dic, gk_params, intercept=False, print_output=True)
 gk_model_df = generate_params_df(gk_model, save_name='gk_tr_total_points')
 #%%
-current_gw = '2024-25-2'
-gk_coeffs = gk_model_df.loc['Coefficients'].median(axis=1)
-latest_data = pd.read_csv('data/2024-25/model_data.csv', index_col=0)
-latest_data = latest_data[latest_data.loc[:, 'gw']==current_gw]
-latest_gk = latest_data[latest_data['position'] == 'GK']
-latest_gk = latest_gk[latest_gk['tr_minutes'] > 70]
-latest_gk['tr_rel'] = latest_gk['tr_total_points'] - latest_gk['tr_xP']
-latest_gk_value = latest_gk.loc[:,['name', 'team', 'tr_minutes', 'value'] + gk_params]
-#%%
-latest_gk_value['y_hat'] = latest_gk_value.loc[
-    :, gk_params[1:]].mul(gk_coeffs, axis = 1).sum(axis =1)
-latest_gk_value['points_gap'] = latest_gk_value['y_hat'] - latest_gk_value['tr_total_points']
-#latest_gk_value.sort_values('points_gap', ascending=False)
-
-#%%
+# y_hat, points_gap, PV, incPV, EPV and incEPV for the current gw
 # PtsVal ratios aren't as useful as incP/incV ratio
 # incPtsVva ratios are the incremental Points earned per incremental V
-# incV is the Val - min(Val)
-# incP is Pts - mean(bottom Val points) 
-gk_base_val_df = latest_gk_value[latest_gk_value['value'] == latest_gk_value['value'].min()]
-#gk_base_val = gk_base_val_df['value'].median()
-gk_base_val = 4
-gk_base_pts = gk_base_val_df.loc[:, 'tr_total_points'].quantile(0.1)
-
-latest_gk_value['incPV'] = (latest_gk_value['tr_total_points'] - gk_base_pts) / (latest_gk_value['value'] - gk_base_val) 
-latest_gk_value['PV'] =  (latest_gk_value['tr_total_points']) / (latest_gk_value['value'])
-latest_gk_value['incEPV'] = (latest_gk_value['y_hat'] - gk_base_pts) / (latest_gk_value['value'] - gk_base_val) 
-latest_gk_value['EPV'] =  (latest_gk_value['y_hat']) / (latest_gk_value['value'])
-
+# incV is the Val - base Val (the position's minimum price)
+# incP is Pts - 10% quantile of the cheapest players' points
+current_gw = '2024-25-2'
+valuer = PlayerValuer({'GK': gk_model_df})
+latest_gk_value = valuer.value(gws=[current_gw], positions=['GK'])
 
 gk_col_order = ['name',
  'team',
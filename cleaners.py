@@ -58,3 +58,24 @@ def get_player_ids(base_filename):
         v = line['first_name'] + '_' + line['second_name']
         player_ids[k] = v
     return player_ids
+
+def get_changed_player_ids(list_of_players, base_filename, fields):
+    """ Gets the ids of players whose fields differ from the last stored snapshot
+
+    Args:
+        list_of_players (list): 'elements' from the bootstrap-static data
+        fields (list): element fields compared against player_snapshot.csv
+    """
+    filename = base_filename + 'player_snapshot.csv'
+    snapshot = {}
+    if os.path.exists(filename):
+        fin = open(filename, 'r+', encoding='utf-8')
+        reader = csv.DictReader(fin)
+        for line in reader:
+            snapshot[int(line['id'])] = [line.get(field) for field in fields]
+    changed = set()
+    for player in list_of_players:
+        current = ['' if player[field] is None else str(player[field]) for field in fields]
+        if snapshot.get(player['id']) != current:
+            changed.add(player['id'])
+    return changed
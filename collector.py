@@ -1,8 +1,11 @@
 #%%
 
 import os
+import re
 import sys
 import csv
+import shutil
+from storage import write_parquet
 
 def get_teams(directory):
     teams = {}
@@ -46,73 +49,170 @@ def get_expected_points(gw, directory):
         return xPoints    
     return xPoints
 
-def merge_gw(gw, gw_directory):
-    merged_gw_filename = "merged_gw.csv"
-    gw_filename = "gw" + str(gw) + ".csv"
-    gw_path = os.path.join(gw_directory, gw_filename)
-    fin = open(gw_path, 'r', encoding="utf-8")
-    reader = csv.DictReader(fin)
-    fieldnames = reader.fieldnames
+def get_merged_gws(merged_path):
+    """ Read which gameweeks are already in merged_gw.csv
+
+    Returns:
+        (fieldnames, set of gws), or None when the file is missing or has no GW header
+    """
+    if not os.path.exists(merged_path):
+        return None
+    with open(merged_path, 'r', encoding="utf-8") as fin:
+        reader = csv.DictReader(fin)
+        if reader.fieldnames == None or "GW" not in reader.fieldnames:
+            return None
+        gws = set(int(row["GW"]) for row in reader)
+        return reader.fieldnames, gws
+
+def get_gw_files(gw_directory):
+    """ Map gameweek number to its gw<N>.csv path for every collected gameweek
+    """
+    gw_files = {}
+    for fname in os.listdir(gw_directory):
+        match = re.match(r'^gw(\d+)\.csv$', fname)
+        if match:
+            gw_files[int(match.group(1))] = os.path.join(gw_directory, fname)
+    return gw_files
+
+def write_gw_rows(writer, gw_path, gw):
+    with open(gw_path, 'r', encoding="utf-8") as fin:
+        for row in csv.DictReader(fin):
+            row["GW"] = gw
+            writer.writerow(row)
+
+def rebuild_merged_gw(gw_directory, gws=None):
+    """ Rewrite merged_gw.csv from the gw<N>.csv files in one streaming pass
+
+    Args:
+        gws (list): gameweeks to include, defaults to every gw<N>.csv in gw_directory
+    """
+    gw_files = get_gw_files(gw_directory)
+    if gws == None:
+        gws = gw_files.keys()
+    gws = sorted(set(gw for gw in gws if gw in gw_files))
+    fieldnames = []
+    for gw in gws:
+        with open(gw_files[gw], 'r', encoding="utf-8") as fin:
+            header = csv.DictReader(fin).fieldnames or []
+        fieldnames += [name for name in header if name not in fieldnames]
     fieldnames += ["GW"]
-    rows = []
-    for row in reader:
-        row["GW"] = gw
-        rows += [row]
-    out_path = os.path.join(gw_directory, merged_gw_filename)
-    fout = open(out_path,'a', encoding="utf-8")
-    writer = csv.DictWriter(fout, fieldnames=fieldnames, lineterminator='\n')
-    print(gw)
-    if gw == 1:
+    out_path = os.path.join(gw_directory, "merged_gw.csv")
+    tmp_path = out_path + ".tmp"
+    with open(tmp_path, 'w', encoding="utf-8") as fout:
+        writer = csv.DictWriter(fout, fieldnames=fieldnames, lineterminator='\n')
         writer.writeheader()
-    for row in rows:
-        writer.writerow(row)
+        for gw in gws:
+            write_gw_rows(writer, gw_files[gw], gw)
+    os.replace(tmp_path, out_path)
+    write_parquet(out_path)
 
-def collect_gw(gw, directory_name, output_dir, root_directory_name="data/2024-25"):
-    rows = []
+def merge_gw(gw, gw_directory):
+    """ Add gameweek gw to merged_gw.csv
+
+    A new gameweek is appended to a copy of the file which then replaces the original,
+    so readers never see a half-written merge. Re-merging a gameweek that is already
+    present, or one whose columns differ from the file, rebuilds the file instead, as does
+    a missing or headerless merged_gw.csv.
+    """
+    out_path = os.path.join(gw_directory, "merged_gw.csv")
+    gw_path = os.path.join(gw_directory, "gw" + str(gw) + ".csv")
+    with open(gw_path, 'r', encoding="utf-8") as fin:
+        fieldnames = csv.DictReader(fin).fieldnames + ["GW"]
+    merged = get_merged_gws(out_path)
+    if merged == None:
+        rebuild_merged_gw(gw_directory)
+        return
+    if merged[0] != fieldnames or gw in merged[1]:
+        rebuild_merged_gw(gw_directory, list(merged[1]) + [gw])
+        return
+    tmp_path = out_path + ".tmp"
+    shutil.copyfile(out_path, tmp_path)
+    with open(tmp_path, 'a', encoding="utf-8") as fout:
+        writer = csv.DictWriter(fout, fieldnames=fieldnames, lineterminator='\n')
+        write_gw_rows(writer, gw_path, gw)
+    os.replace(tmp_path, out_path)
+    write_parquet(out_path)
+
+_lookups = {}
+
+def get_lookups(root_directory_name):
+    """ Load the teams, fixtures and player lookups for a season
+
+    The lookups are kept between calls and only re-read once one of the
+    underlying csv files has been modified
+    """
+    paths = [os.path.join(root_directory_name, f) for f in ["teams.csv", "fixtures.csv", "players_raw.csv"]]
+    mtimes = [os.path.getmtime(path) for path in paths]
+    cached = _lookups.get(root_directory_name)
+    if cached is None or cached[0] != mtimes:
+        fixtures_home, fixtures_away = get_fixtures(root_directory_name)
+        teams = get_teams(root_directory_name)
+        names, positions = get_positions(root_directory_name)
+        cached = (mtimes, (fixtures_home, fixtures_away, teams, names, positions))
+        _lookups[root_directory_name] = cached
+    return cached[1]
+
+def collect_gws(gws, directory_name, output_dir, root_directory_name="data/2024-25"):
+    """ Write gw<N>.csv for several gameweeks from a single pass over the player files
+
+    Every player's gw.csv is read once and its rows are partitioned by round.
+
+    Args:
+        gws (list): gameweeks to write, None for every round found in the player files
+    """
     fieldnames = []
-    fixtures_home, fixtures_away = get_fixtures(root_directory_name)
-    teams = get_teams(root_directory_name)
-    names, positions = get_positions(root_directory_name)
-    xPoints = get_expected_points(gw, output_dir)
+    fixtures_home, fixtures_away, teams, names, positions = get_lookups(root_directory_name)
+    rows = {}
+    if gws != None:
+        rows = {gw: [] for gw in gws}
+    xPoints = {}
     for root, dirs, files in os.walk(u"./" + directory_name):
-        for fname in files:
-            if fname == 'gw.csv':
-                fpath = os.path.join(root, fname)
-                fin = open(fpath, 'r')
-                reader = csv.DictReader(fin)
-                fieldnames = reader.fieldnames
-                for row in reader:
-                    if int(row['round']) == gw:
-                        id = int(os.path.basename(root).split('_')[-1])
-                        name = names[id]
-                        position = positions[id]
-                        fixture = int(row['fixture'])
-                        if row['was_home'] == True or row['was_home'] == "True":
-                            row['team'] = teams[fixtures_home[fixture]]
-                        else:
-                            row['team'] = teams[fixtures_away[fixture]]
-                        row['name'] = name
-                        row['position'] = position
-                        if id in xPoints:
-                            row['xP'] = xPoints[id]
-                        else:
-                            row['xP'] = 0.0
-                        rows += [row]
+        if 'gw.csv' not in files:
+            continue
+        fpath = os.path.join(root, 'gw.csv')
+        id = int(os.path.basename(root).split('_')[-1])
+        with open(fpath, 'r') as fin:
+            reader = csv.DictReader(fin)
+            fieldnames = reader.fieldnames
+            for row in reader:
+                gw = int(row['round'])
+                if gw not in rows:
+                    if gws != None:
+                        continue
+                    rows[gw] = []
+                if gw not in xPoints:
+                    xPoints[gw] = get_expected_points(gw, output_dir)
+                fixture = int(row['fixture'])
+                if row['was_home'] == True or row['was_home'] == "True":
+                    row['team'] = teams[fixtures_home[fixture]]
+                else:
+                    row['team'] = teams[fixtures_away[fixture]]
+                row['name'] = names[id]
+                row['position'] = positions[id]
+                if id in xPoints[gw]:
+                    row['xP'] = xPoints[gw][id]
+                else:
+                    row['xP'] = 0.0
+                rows[gw] += [row]
 
     fieldnames = ['name', 'position', 'team', 'xP'] + fieldnames
-    outf = open(os.path.join(output_dir, "gw" + str(gw) + ".csv"), 'w', encoding="utf-8")
-    writer = csv.DictWriter(outf, fieldnames=fieldnames, lineterminator='\n')
-    writer.writeheader()
-    for row in rows:
-        writer.writerow(row)
+    for gw in sorted(rows):
+        out_path = os.path.join(output_dir, "gw" + str(gw) + ".csv")
+        with open(out_path, 'w', encoding="utf-8") as outf:
+            writer = csv.DictWriter(outf, fieldnames=fieldnames, lineterminator='\n')
+            writer.writeheader()
+            for row in rows[gw]:
+                writer.writerow(row)
+        write_parquet(out_path)
+
+def collect_gw(gw, directory_name, output_dir, root_directory_name="data/2024-25"):
+    collect_gws([gw], directory_name, output_dir, root_directory_name)
 
 def collect_all_gws(directory_name, output_dir, root_dir):
-    for i in range(1,17):
-        collect_gw(i, directory_name, output_dir, root_dir)
+    collect_gws(None, directory_name, output_dir, root_dir)
 
 def merge_all_gws(num_gws, gw_directory):
-    for i in range(1, num_gws):
-        merge_gw(i, gw_directory)
+    rebuild_merged_gw(gw_directory, range(1, num_gws + 1))
 
 def main():
     #collect_all_gws(sys.argv[1], sys.argv[2], sys.argv[3])
@@ -1,8 +1,29 @@
-import requests
+import os
+import threading
 from bs4 import BeautifulSoup
 from bs4 import Comment
-import time
+from urllib.robotparser import RobotFileParser
 import csv
+import pandas as pd
+from fetcher import RateLimiter, fetch_concurrently
+from http_client import HttpClient
+from storage import write_table
+
+# lxml is optional: without it match logs are parsed with BeautifulSoup's html.parser
+try:
+    import lxml.html
+    HAS_LXML = True
+except ImportError:
+    HAS_LXML = False
+
+FBREF_HOST = 'fbref.com'
+# fbref blocks clients making more than 10 requests a minute
+FBREF_REQUESTS_PER_SECOND = 1 / 6
+
+# match log columns holding a link whose text is the value
+LINK_STATS = ['date', 'round', 'comp', 'opponent', 'squad']
+# match log columns kept as text, every other column is numeric
+TEXT_STATS = LINK_STATS + ['dayofweek', 'venue', 'result', 'game_started', 'position', 'bench_explain', 'match_report']
 
 class MatchData:
     def __init__(self) -> None:
@@ -21,10 +42,7 @@ class PlayerData:
         self.match_stat_set = set()
 
 def get_data(url):
-    response = requests.get(url)
-    if response.status_code != 200:
-        raise Exception("Response was code " + str(response.status_code))
-    html = response.text
+    html = get_client().get(url).text
     parsed_html =  BeautifulSoup(html, 'html.parser')
     comments = parsed_html.find_all(string=lambda text: isinstance(text, Comment))
     tables = []
@@ -34,48 +52,99 @@ def get_data(url):
             tables = table_html.find_all('table')
     return tables
 
-def get_table_data(url):
-    status_code = 0
-    while status_code != 200:
-        print("Getting data for: " + url)
-        response = requests.get(url)
-        status_code = response.status_code
-        if status_code != 200:
-            time.sleep(5)
-    html = response.text
-    parsed_html = BeautifulSoup(html, 'html.parser')
-    tables = parsed_html.find_all('table')
-    return tables[0]
-
-def get_matches_data(player):
-    tables = []
-    for l in player.matches_links:
-        tables += [get_table_data(l)]
+def get_fbref_client(requests_per_second=FBREF_REQUESTS_PER_SECOND):
+    """ Client for fbref limited to requests_per_second, or to the robots.txt crawl delay if that is slower
+    """
+    client = HttpClient(rate_limiter=RateLimiter(requests_per_second))
+    robots = RobotFileParser()
+    try:
+        robots.parse(client.get('https://' + FBREF_HOST + '/robots.txt').text.splitlines())
+        delay = robots.crawl_delay('*')
+    except Exception:
+        delay = None
+    if delay is not None and float(delay) > 1 / requests_per_second:
+        client.rate_limiter = RateLimiter(1 / float(delay))
+    return client
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_client():
+    """ Return the shared fbref client, creating it on first use
+
+    Every fbref request made without an explicit client goes through it, so they all share one rate limit.
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = get_fbref_client()
+        return _client
+
+def iter_rows(html):
+    """ (row classes, [(data-stat, text, link texts)]) for each body row of the page's first table
+    """
+    if HAS_LXML:
+        table = lxml.html.fromstring(html).xpath('//table')[0]
+        for row in table.xpath('./tbody/tr'):
+            yield row.get('class', '').split(), [(c.get('data-stat'), c.text_content(), [a.text_content() for a in c.iter('a')]) for c in row.xpath('./td|./th')]
+    else:
+        table = BeautifulSoup(html, 'html.parser').find('table')
+        for row in table.tbody.find_all('tr'):
+            yield row.get('class') or [], [(c.get('data-stat'), c.get_text(), [a.get_text() for a in c.find_all('a')]) for c in row.find_all(['td', 'th'])]
+
+def parse_match_log(html):
+    """ Rows of a player's match log page, parsed in a single pass
+
+    Header and spacer rows are skipped but unused substitute rows are kept.
+
+    Returns:
+        tuple: list of {data-stat: value} rows, set of every data-stat seen
+    """
+    rows = []
+    stat_names = set()
+    for classes, cells in iter_rows(html):
+        if len(classes) > 0 and 'unused_sub' not in classes:
+            continue
+        data = {}
+        for stat, text, links in cells:
+            if stat is None:
+                continue
+            stat_names.add(stat)
+            links = [link for link in links if link != '']
+            if stat in LINK_STATS:
+                if len(links) > 0:
+                    data[stat] = links[-1]
+            elif stat != 'match_report' and text != '':
+                data[stat] = text
+        rows += [data]
+    return rows, stat_names
+
+def match_log_table(rows, stat_names):
+    """ Typed table of match log rows: dates as datetimes, text columns as categories and the rest numeric
+    """
+    df = pd.DataFrame.from_records(rows, columns=sorted(stat_names))
+    for col in df.columns:
+        if col == 'date':
+            df[col] = pd.to_datetime(df[col], errors='coerce')
+        elif col in TEXT_STATS:
+            df[col] = df[col].astype('category')
+        else:
+            df[col] = pd.to_numeric(df[col].astype(str).str.replace(',', ''), errors='coerce')
+    return df
+
+def get_table_data(url, client=None):
+    if client is None:
+        client = get_client()
+    print("Getting data for: " + url)
+    return client.get(url).text
+
+def get_matches_data(player, client=None):
     matches = []
     match_stat_set = set()
-    for t in tables:
-        for row in t.tbody.find_all('tr'):
-            data = {}
-            class_name = row.get('class')
-            if class_name != None and len(class_name) > 0 and 'unused_sub' not in class_name:
-                continue
-            columns = row.find_all('td') + row.find_all('th')
-            for c in columns:
-                data_stat = c.get('data-stat')
-                match_stat_set.add(data_stat)
-                if data_stat in ['date', 'round', 'comp', 'opponent', 'squad']:
-                    for i in range(len(c.contents)):
-                        a_html = BeautifulSoup(str(c.contents[i]), 'html.parser')
-                        a = a_html.find_all('a')
-                        if len(a) > 0:
-                            if len(a[0].contents) > 0:
-                                data[data_stat] = a[0].contents[0]
-                elif data_stat == 'match_report':
-                    continue
-                else:
-                    if len(c.contents) == 0:
-                        continue
-                    data[data_stat] = c.contents[0]
+    for l in player.matches_links:
+        rows, stat_names = parse_match_log(get_table_data(l, client))
+        match_stat_set |= stat_names
+        for data in rows:
             match = MatchData()
             match.date = data['date']
             match.round = data['round']
@@ -85,6 +154,41 @@ def get_matches_data(player):
     player.matches = matches
     player.match_stat_set = match_stat_set
 
+def get_match_logs(players, outdir, client=None, max_workers=4):
+    """ Fetch every player's match logs concurrently and write each as a typed table at <outdir>/<player id>.csv
+
+    All requests go through one rate limited client, so fbref is never asked for more than its limit
+    however many workers there are. A player whose pages fail after retries is reported and skipped.
+
+    Args:
+        players (dict): {player id: PlayerData} as returned by get_epl_players
+        outdir (str): folder for the per-player tables
+        client (HttpClient, optional): client to fetch with, the shared fbref client if not given
+        max_workers (int): maximum number of pages in flight at once
+
+    Returns:
+        list: ids of the players that failed
+    """
+    if client is None:
+        client = get_client()
+    os.makedirs(outdir, exist_ok=True)
+
+    def fetch(player_id):
+        try:
+            frames = [match_log_table(*parse_match_log(client.get(l).text)) for l in players[player_id].matches_links]
+        except Exception as e:
+            print("Failed to get matches for " + player_id + ": " + str(e))
+            return None
+        return pd.concat(frames, ignore_index=True)
+
+    failed = []
+    for player_id, table in fetch_concurrently(fetch, players.keys(), max_workers):
+        if table is None:
+            failed += [player_id]
+            continue
+        write_table(table, os.path.join(outdir, player_id + '.csv'), index=False)
+    return failed
+
 def get_epl_players():
     tables = get_data("https://fbref.com/en/comps/9/stats/Premier-League-Stats")
     table = tables[0]
@@ -110,6 +214,9 @@ def get_epl_players():
                 player_id = pieces[3]
                 stats[data_stat] = a[0].contents[0]
                 stat_names.add(data_stat)
+                # kept so the overview can be matched to FPL ids by player_identity
+                stats['player_id'] = player_id
+                stat_names.add('player_id')
             elif data_stat == 'squad':
                 a_html = BeautifulSoup(str(c.contents[0]), 'html.parser')
                 a = a_html.find_all('a')
@@ -141,18 +248,11 @@ def get_epl_players():
     return players, stat_names
             
 
-def main():
+def main(season='2021-22'):
     players, stats = get_epl_players()
+    get_match_logs(players, os.path.join('data', season, 'fbref'))
 
-    for id, player in players.items():
-        get_matches_data(player)
-        with open('data/2021-22/fbref/' + id + '.csv', 'w') as outf:
-            writer = csv.DictWriter(outf, fieldnames=list(player.match_stat_set))
-            writer.writeheader()
-            for match in player.matches:
-                writer.writerow(match.data)
-
-    with open('data/2021-22/fbref_overview.csv', 'w') as outf:
+    with open(os.path.join('data', season, 'fbref_overview.csv'), 'w') as outf:
         writer = csv.DictWriter(outf, fieldnames=list(stats))
         writer.writeheader()
         for id, player in players.items():
@@ -160,4 +260,4 @@ def main():
                 writer.writerow(data)
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,230 @@
+import itertools
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from model_functions import build_position_dic
+from batch_regression import design_matrix
+
+# search over regressor subsets for a position, ranking specifications by out-of-season error
+# each season is reduced once to the Gram matrix of [const, candidates..., y], every subset's
+# X'X, X'y and y'y are then slices of it, so no model ever goes back to the data
+
+# columns build_position_dic derives from others, left out of the default candidates when y is one of their sources
+DERIVED_COLUMNS = {'tr_rel': ['tr_total_points', 'tr_xP']}
+
+# a subset whose in-sample sse is below this share of y'y reproduces y and is not scored
+EXACT_FIT_TOLERANCE = 1e-9
+
+def build_grams(data_dic, position, y, candidates = None, intercept = True, minute_filter = 80):
+    """
+    Summary:
+        per-season Gram matrices of [const, candidates..., y] for one position
+        rows are filtered as in run_regression, with missing values dropped over all candidates so that every subset is scored on the same sample
+
+    Args:
+        data_dic (dic): dictionary of {season: data_df}
+        position (str): GK, DEF, FWD, MID
+        y (str): dependent variable
+        candidates (lst, optional): regressors to search over, defaults to every tr_ column other than y and the columns derived from it
+        intercept (bool): include a constant in every model
+        minute_filter (int): to exclude players with trailing ave mpg below given threshold
+
+    Returns:
+        dic: {'candidates', 'intercept', 'seasons', 'grams' (seasons, p, p), 'nobs' (seasons,)}
+    """
+    position_dic = build_position_dic(data_dic, position)
+    seasons = list(data_dic.keys())
+    if len(seasons) < 2:
+        raise ValueError('At least two seasons are needed to score models out of season')
+    if candidates == None:
+        columns = position_dic[seasons[0]].columns
+        candidates = [col for col in columns if col.startswith('tr_') and col != y and y not in DERIVED_COLUMNS.get(col, [])]
+
+    grams = []
+    nobs = []
+    for season in seasons:
+        y_data, x_data, _ = design_matrix(position_dic[season], y, candidates, intercept, minute_filter)
+        z = np.column_stack([x_data, y_data])
+        grams += [z.T @ z]
+        nobs += [len(y_data)]
+
+    return {
+        'candidates': list(candidates),
+        'intercept': intercept,
+        'seasons': seasons,
+        'grams': np.array(grams),
+        'nobs': np.array(nobs),
+        }
+
+def held_out_sse(train, test, cols, yi):
+    """
+    Summary:
+        fits every subset on the train Grams and returns its sum of squared errors on the test Grams
+
+    Args:
+        train (array): (s, p, p) Gram matrices to fit on
+        test (array): (s, p, p) Gram matrices to evaluate on
+        cols (array): (m, k) design column indices of each subset
+        yi (int): column index of y
+
+    Returns:
+        array: (s, m) sums of squared errors
+    """
+    rows, columns = cols[:, :, None], cols[:, None, :]
+    beta = np.einsum('smij,smj->smi', np.linalg.pinv(train[:, rows, columns]), train[:, cols, yi])
+    sse = (
+        test[:, yi, yi][:, None]
+        - 2 * np.einsum('smi,smi->sm', beta, test[:, cols, yi])
+        + np.einsum('smi,smij,smj->sm', beta, test[:, rows, columns], beta)
+        )
+    return np.maximum(sse, 0)
+
+def score_subsets(grams, subsets):
+    """
+    Summary:
+        scores regressor subsets by leave-one-season-out error: each season is predicted from a model fitted on all the others
+        subsets that reproduce y exactly (eg through a column derived from it) get an infinite error
+
+    Args:
+        grams (dic): output of build_grams
+        subsets (lst): tuples of candidate indices, all subsets of one size are solved as a single batch
+
+    Returns:
+        df: one row per subset with its regressors, k, out-of-season rmse, per-season out-of-season rmse and in-sample rmse
+    """
+    g = grams['grams']
+    nobs = grams['nobs']
+    offset = 1 if grams['intercept'] else 0
+    yi = g.shape[1] - 1
+    total = g.sum(axis = 0)
+
+    results = []
+    for k in sorted(set(len(subset) for subset in subsets)):
+        group = [subset for subset in subsets if len(subset) == k]
+        cols = np.array([list(range(offset)) + [i + offset for i in subset] for subset in group], dtype = int)
+        oos = held_out_sse(total[None] - g, g, cols, yi)
+        fit = held_out_sse(total[None], total[None], cols, yi)[0]
+        exact = fit <= EXACT_FIT_TOLERANCE * total[yi, yi]
+        oos[:, exact] = np.inf
+        with np.errstate(divide = 'ignore', invalid = 'ignore'):
+            season_rmse = np.sqrt(oos / nobs[:, None])
+        frame = pd.DataFrame({
+            'regressors': [tuple(grams['candidates'][i] for i in subset) for subset in group],
+            'k': k,
+            'oos_rmse': np.sqrt(oos.sum(axis = 0) / nobs.sum()),
+            'in_sample_rmse': np.sqrt(fit / nobs.sum()),
+            })
+        for s, season in enumerate(grams['seasons']):
+            frame[f'oos_rmse_{season}'] = season_rmse[s]
+        results += [frame]
+
+    return pd.concat(results, axis = 0, ignore_index = True)
+
+def score_subsets_parallel(grams, subsets, max_workers = None, chunk_size = 5000):
+    """
+    Summary:
+        score_subsets over chunks of subsets on a process pool, only the Gram matrices are sent to the workers
+    """
+    chunks = [subsets[i:i + chunk_size] for i in range(0, len(subsets), chunk_size)]
+    if len(chunks) <= 1:
+        return rank_models(score_subsets(grams, subsets))
+    with ProcessPoolExecutor(max_workers = max_workers) as executor:
+        frames = list(executor.map(score_subsets, [grams] * len(chunks), chunks))
+    return rank_models(pd.concat(frames, axis = 0, ignore_index = True))
+
+def rank_models(scores):
+    scores = scores[np.isfinite(scores['oos_rmse'])]
+    return scores.sort_values(['oos_rmse', 'k'], kind = 'stable').reset_index(drop = True)
+
+def exhaustive_search(grams, max_k = 4, min_k = 1, max_workers = None):
+    """
+    Summary:
+        scores every subset of between min_k and max_k candidates
+
+    Returns:
+        df: scores ranked by out-of-season rmse
+    """
+    p = len(grams['candidates'])
+    subsets = [subset for k in range(min_k, max_k + 1) for subset in itertools.combinations(range(p), k)]
+    return score_subsets_parallel(grams, subsets, max_workers = max_workers)
+
+def forward_stepwise(grams, max_k = None):
+    """
+    Summary:
+        adds the candidate that most reduces out-of-season rmse until none does or max_k is reached
+
+    Returns:
+        df: the best model at each step, in order
+    """
+    p = len(grams['candidates'])
+    max_k = p if max_k == None else max_k
+    current = ()
+    best = np.inf
+    path = []
+    while len(current) < max_k:
+        trials = [tuple(sorted(current + (i,))) for i in range(p) if i not in current]
+        scores = score_subsets(grams, trials)
+        step = scores['oos_rmse'].idxmin()
+        if scores.loc[step, 'oos_rmse'] >= best:
+            break
+        best = scores.loc[step, 'oos_rmse']
+        current = trials[step]
+        path += [scores.loc[[step]]]
+    if len(path) == 0:
+        return pd.DataFrame()
+    return pd.concat(path, axis = 0, ignore_index = True)
+
+def backward_stepwise(grams, min_k = 1):
+    """
+    Summary:
+        starting from every candidate, drops the one whose removal most reduces out-of-season rmse until none does or min_k is reached
+
+    Returns:
+        df: the full model followed by the best model at each step, in order
+    """
+    p = len(grams['candidates'])
+    current = tuple(range(p))
+    path = [score_subsets(grams, [current])]
+    best = path[0].loc[0, 'oos_rmse']
+    while len(current) > min_k:
+        trials = [tuple(i for i in current if i != j) for j in current]
+        scores = score_subsets(grams, trials)
+        step = scores['oos_rmse'].idxmin()
+        if scores.loc[step, 'oos_rmse'] >= best:
+            break
+        best = scores.loc[step, 'oos_rmse']
+        current = trials[step]
+        path += [scores.loc[[step]]]
+    return pd.concat(path, axis = 0, ignore_index = True)
+
+def search(data_dic, position, y, candidates = None, method = 'exhaustive', max_k = 4, intercept = True, minute_filter = 80, max_workers = None):
+    """
+    Summary:
+        builds the Gram matrices for a position and runs one of the searches over them
+
+    Args:
+        data_dic (dic): dictionary of {season: data_df}
+        position (str): GK, DEF, FWD, MID
+        y (str): dependent variable
+        candidates (lst, optional): regressors to search over, defaults to every tr_ column other than y
+        method (str): 'exhaustive', 'forward' or 'backward'
+        max_k (int): largest subset size for exhaustive and forward searches
+        intercept (bool): include a constant in every model
+        minute_filter (int): to exclude players with trailing ave mpg below given threshold
+        max_workers (int, optional): worker processes for the exhaustive search. Defaults to the number of cpus.
+
+    Returns:
+        df: scored models, ranked for exhaustive searches and in step order for stepwise ones
+    """
+    grams = build_grams(data_dic, position, y, candidates, intercept, minute_filter)
+    if method == 'exhaustive':
+        scores = exhaustive_search(grams, max_k, max_workers = max_workers)
+    elif method == 'forward':
+        scores = forward_stepwise(grams, max_k)
+    elif method == 'backward':
+        scores = backward_stepwise(grams)
+    else:
+        raise NameError("method must be one of ['exhaustive', 'forward', 'backward']")
+    if len(scores) > 0 and scores['oos_rmse'].min() == 0:
+        raise ValueError('The best model predicts ' + y + ' without error, a candidate is likely derived from it')
+    return scores
@@ -0,0 +1,70 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+class RateLimiter:
+    """ Thread-safe limiter that spaces out requests to each host
+
+    Args:
+        rate (float): maximum number of requests per second allowed for any one host
+    """
+    def __init__(self, rate):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.interval = 1.0 / rate
+        self.next_slot = {}
+        self.paused_until = {}
+        self.lock = threading.Lock()
+
+    def wait(self, host):
+        """ Block until a request to host is allowed
+        """
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                slot = max(now, self.next_slot.get(host, now))
+                self.next_slot[host] = slot + self.interval
+                paused = self.paused_until.get(host)
+            delay = slot - now
+            if delay > 0:
+                time.sleep(delay)
+            # a pause asked for while waiting voids the slot, so take a new one after the pause
+            with self.lock:
+                if self.paused_until.get(host) == paused:
+                    return
+
+    def defer(self, host, seconds):
+        """ Hold back every request to host for at least the given number of seconds, eg after a Retry-After
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.paused_until[host] = max(self.paused_until.get(host, now), now + seconds)
+            self.next_slot[host] = max(self.next_slot.get(host, now), self.paused_until[host])
+
+def fetch_concurrently(fetch, keys, max_workers=8, rate_limiter=None, host=None):
+    """ Call fetch(key) for every key on a bounded thread pool
+
+    Results are yielded as (key, result) pairs in completion order, so the caller can
+    write each one out as soon as it arrives. Any exception raised by fetch is re-raised
+    when its result is reached.
+
+    Args:
+        fetch (function): function taking a single key and returning its data
+        keys (iterable): keys to fetch
+        max_workers (int): maximum number of fetches in flight at once
+        rate_limiter (RateLimiter, optional): limiter consulted before every fetch
+        host (str, optional): host name passed to the rate limiter
+    """
+    def limited_fetch(key):
+        if rate_limiter is not None:
+            rate_limiter.wait(host)
+        return fetch(key)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(limited_fetch, key): key for key in keys}
+        try:
+            for future in as_completed(futures):
+                yield futures[future], future.result()
+        finally:
+            for future in futures:
+                future.cancel()
@@ -1,16 +1,14 @@
-import requests
 import json
-import time
+import os
+from http_client import get_client
+
+# override with FPL_API_BASE to point the getters at a local stand-in server
+BASE_URL = os.environ.get("FPL_API_BASE", "https://fantasy.premierleague.com/api/")
 
 def get_data():
     """ Retrieve the fpl player data from the hard-coded url
     """
-    response = requests.get("https://fantasy.premierleague.com/api/bootstrap-static/")
-    if response.status_code != 200:
-        raise Exception("Response was code " + str(response.status_code))
-    responseStr = response.text
-    data = json.loads(responseStr)
-    return data
+    return get_client().get_json(BASE_URL + "bootstrap-static/")
 
 def get_individual_player_data(player_id):
     """ Retrieve the player-specific detailed data
@@ -18,18 +16,8 @@ def get_individual_player_data(player_id):
     Args:
         player_id (int): ID of the player whose data is to be retrieved
     """
-    base_url = "https://fantasy.premierleague.com/api/element-summary/"
-    full_url = base_url + str(player_id) + "/"
-    response = ''
-    while response == '':
-        try:
-            response = requests.get(full_url)
-        except:
-            time.sleep(5)
-    if response.status_code != 200:
-        raise Exception("Response was code " + str(response.status_code))
-    data = json.loads(response.text)
-    return data
+    full_url = BASE_URL + "element-summary/" + str(player_id) + "/"
+    return get_client().get_json(full_url)
 
 def get_entry_data(entry_id):
     """ Retrieve the summary/history data for a specific entry/team
@@ -37,18 +25,8 @@ def get_entry_data(entry_id):
     Args:
         entry_id (int) : ID of the team whose data is to be retrieved
     """
-    base_url = "https://fantasy.premierleague.com/api/entry/"
-    full_url = base_url + str(entry_id) + "/history/"
-    response = ''
-    while response == '':
-        try:
-            response = requests.get(full_url)
-        except:
-            time.sleep(5)
-    if response.status_code != 200:
-        raise Exception("Response was code " + str(response.status_code))
-    data = json.loads(response.text)
-    return data
+    full_url = BASE_URL + "entry/" + str(entry_id) + "/history/"
+    return get_client().get_json(full_url)
 
 def get_entry_personal_data(entry_id):
     """ Retrieve the summary/history data for a specific entry/team
@@ -56,18 +34,8 @@ def get_entry_personal_data(entry_id):
     Args:
         entry_id (int) : ID of the team whose data is to be retrieved
     """
-    base_url = "https://fantasy.premierleague.com/api/entry/"
-    full_url = base_url + str(entry_id) + "/"
-    response = ''
-    while response == '':
-        try:
-            response = requests.get(full_url)
-        except:
-            time.sleep(5)
-    if response.status_code != 200:
-        raise Exception("Response was code " + str(response.status_code))
-    data = json.loads(response.text)
-    return data
+    full_url = BASE_URL + "entry/" + str(entry_id) + "/"
+    return get_client().get_json(full_url)
 
 def get_entry_gws_data(entry_id,num_gws,start_gw=1):
     """ Retrieve the gw-by-gw data for a specific entry/team
@@ -75,55 +43,44 @@ def get_entry_gws_data(entry_id,num_gws,start_gw=1):
     Args:
         entry_id (int) : ID of the team whose data is to be retrieved
     """
-    base_url = "https://fantasy.premierleague.com/api/entry/"
     gw_data = []
     for i in range(start_gw, num_gws+1):
-        full_url = base_url + str(entry_id) + "/event/" + str(i) + "/picks/"
-        response = ''
-        while response == '':
-            try:
-                response = requests.get(full_url)
-            except:
-                time.sleep(5)
-        if response.status_code != 200:
-            raise Exception("Response was code " + str(response.status_code))
-        data = json.loads(response.text)
-        gw_data += [data]
+        gw_data += [get_entry_gw_picks(entry_id, i)]
     return gw_data
 
+def get_entry_gw_picks(entry_id, gw):
+    """ Retrieve the picks of a specific entry/team for one gw
+
+    Args:
+        entry_id (int) : ID of the team whose data is to be retrieved
+        gw (int) : gameweek of the picks
+    """
+    full_url = BASE_URL + "entry/" + str(entry_id) + "/event/" + str(gw) + "/picks/"
+    return get_client().get_json(full_url)
+
 def get_entry_transfers_data(entry_id):
     """ Retrieve the transfer data for a specific entry/team
 
     Args:
         entry_id (int) : ID of the team whose data is to be retrieved
     """
-    base_url = "https://fantasy.premierleague.com/api/entry/"
-    full_url = base_url + str(entry_id) + "/transfers/"
-    response = ''
-    while response == '':
-        try:
-            response = requests.get(full_url)
-        except:
-            time.sleep(5)
-    if response.status_code != 200:
-        raise Exception("Response was code " + str(response.status_code))
-    data = json.loads(response.text)
-    return data
+    full_url = BASE_URL + "entry/" + str(entry_id) + "/transfers/"
+    return get_client().get_json(full_url)
+
+def get_league_standings(league_id, page=1):
+    """ Retrieve one page (50 entries) of a classic league's standings
+
+    Args:
+        league_id (int) : ID of the league, eg 314 for the overall league
+        page (int) : page of the standings, starting at 1
+    """
+    full_url = BASE_URL + "leagues-classic/" + str(league_id) + "/standings/?page_standings=" + str(page)
+    return get_client().get_json(full_url)
 
 def get_fixtures_data():
     """ Retrieve the fixtures data for the season
     """
-    url = "https://fantasy.premierleague.com/api/fixtures/"
-    response = ''
-    while response == '':
-        try:
-            response = requests.get(url)
-        except:
-            time.sleep(5)
-    if response.status_code != 200:
-        raise Exception("Response was code " + str(response.status_code))
-    data = json.loads(response.text)
-    return data
+    return get_client().get_json(BASE_URL + "fixtures/")
 
 def main():
     data = get_data()
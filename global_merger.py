@@ -1,34 +1,73 @@
 from mergers import *
+from player_keys import get_element_keys
 
-def merge_data():
-    """ Merge all the data and export to a new file
-    """
-    season_latin = ['2016-17', '2017-18', '2018-19', '2019-20', '2020-21', '2021-22', '2022-23'] 
-    encoding_latin = ['latin-1', 'latin-1', 'latin-1', 'utf-8', 'utf-8', 'utf-8', 'utf-8']
-
-    dfs = []
-    for i,j in zip(season_latin, encoding_latin):
-        data = pd.read_csv(import_merged_gw(season=f'{i}'), encoding=f'{j}')
-        data['season'] = i
-        dfs.append(data)
-
-    df = pd.concat(dfs, ignore_index=True, sort=False)
-    df = df[['season','name', 'position', 'team', 'assists','bonus','bps','clean_sheets','creativity','element','fixture','goals_conceded','goals_scored','ict_index','influence','kickoff_time','minutes','opponent_team','own_goals','penalties_missed','penalties_saved','red_cards','round','saves','selected','team_a_score','team_h_score','threat','total_points','transfers_balance','transfers_in','transfers_out','value','was_home','yellow_cards','GW']]
+SEASONS = ['2016-17', '2017-18', '2018-19', '2019-20', '2020-21', '2021-22', '2022-23']
 
-    df = clean_players_name_string(df, col='name')
-    df = filter_players_exist_latest(df, col='position')
-    df = get_opponent_team_name(df)
+# columns read from each season's merged_gw.csv, with the types every season is cast to
+MERGED_TYPES = {'name': 'string', 'position': 'string', 'team': 'string', 'assists': 'Int64', 'bonus': 'Int64', 'bps': 'Int64',
+                'clean_sheets': 'Int64', 'creativity': 'float64', 'element': 'Int64', 'fixture': 'Int64', 'goals_conceded': 'Int64',
+                'goals_scored': 'Int64', 'ict_index': 'float64', 'influence': 'float64', 'kickoff_time': 'string', 'minutes': 'Int64',
+                'opponent_team': 'Int64', 'own_goals': 'Int64', 'penalties_missed': 'Int64', 'penalties_saved': 'Int64',
+                'red_cards': 'Int64', 'round': 'Int64', 'saves': 'Int64', 'selected': 'Int64', 'team_a_score': 'float64',
+                'team_h_score': 'float64', 'threat': 'float64', 'total_points': 'Int64', 'transfers_balance': 'Int64',
+                'transfers_in': 'Int64', 'transfers_out': 'Int64', 'value': 'Int64', 'was_home': 'boolean', 'yellow_cards': 'Int64',
+                'GW': 'Int64'}
 
-    df = df[['season_x', 'name', 'position', 'team_x', 'assists', 'bonus', 'bps',
+# header of cleaned_merged_seasons.csv, kept from the original concatenate-and-merge version
+OUTPUT_COLUMNS = ['season_x', 'name', 'position', 'team_x', 'assists', 'bonus', 'bps',
        'clean_sheets', 'creativity', 'element', 'fixture', 'goals_conceded',
        'goals_scored', 'ict_index', 'influence', 'kickoff_time', 'minutes',
        'opponent_team', 'opp_team_name', 'own_goals', 'penalties_missed', 'penalties_saved',
        'red_cards', 'round', 'saves', 'selected', 'team_a_score',
        'team_h_score', 'threat', 'total_points', 'transfers_balance',
        'transfers_in', 'transfers_out', 'value', 'was_home', 'yellow_cards',
-       'GW']]
-    
-    export_cleaned_data(df)
+       'GW']
+
+def read_season(season, columns):
+    """ A season's merged_gw.csv with only the given columns, cast to MERGED_TYPES and with cleaned names
+
+    Columns a season does not have are left empty.
+    """
+    df = read_table(import_merged_gw(season=season), columns=columns).reindex(columns=columns)
+    df = df.astype({col: MERGED_TYPES[col] for col in columns})
+    return clean_players_name_string(df, col='name')
+
+def get_positions(seasons):
+    """ Positions of every row of every season after filling them across seasons, as one array per season
+
+    Only the name, element and position columns are read, so this pass stays small however many seasons there are.
+    Rows are grouped by player_key.
+    """
+    dfs = []
+    for season in seasons:
+        df = read_season(season, ['name', 'element', 'position'])
+        df['player_key'] = get_element_keys(season, df['element'], df['name'])
+        dfs.append(df)
+    lengths = [len(df) for df in dfs]
+    df = pd.concat(dfs, ignore_index=True)
+    positions = fill_positions(df['player_key'], df['position']).to_numpy()
+    return np.split(positions, np.cumsum(lengths)[:-1])
+
+def merged_seasons(seasons):
+    """ Yield each season's cleaned rows in the cleaned_merged_seasons.csv layout
+    """
+    team_names = get_team_names()
+    for season, positions in zip(seasons, get_positions(seasons)):
+        df = read_season(season, list(MERGED_TYPES))
+        df['position'] = pd.Series(positions, index=df.index, dtype='string')
+        df = df[df['position'].notnull()]
+        df['opp_team_name'] = df['opponent_team'].map(team_names.get(season, {})).astype('string')
+        df = df.rename(columns={'team': 'team_x'})
+        df['season_x'] = season
+        yield df[OUTPUT_COLUMNS]
+
+def merge_data(seasons=SEASONS):
+    """ Merge all the data and export to a new file
+
+    Seasons are read and written one at a time, so only one season's rows are held in memory.
+    Positions are filled across seasons in a first pass that reads only names and positions.
+    """
+    export_cleaned_chunks(merged_seasons(seasons))
 
 def main():
     merge_data()
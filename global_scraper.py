@@ -5,19 +5,47 @@ from cleaners import *
 from getters import *
 from collector import collect_gw, merge_gw
 from understat import parse_epl_data
+from player_keys import build_player_keys
+from fetcher import RateLimiter, fetch_concurrently
+from http_client import configure_client
+from response_cache import ResponseCache
 import csv
 
-def parse_data(season, gw = None):
+FPL_HOST = 'fantasy.premierleague.com'
+# event and team_fixtures move every gameweek, so players who did not play (and only gained a 0 minute row) are refetched too
+SNAPSHOT_FIELDS = ['total_points', 'minutes', 'event_points', 'event', 'team_fixtures']
+
+def get_snapshot_players(elements, fixtures_data, gw_num):
+    """ Elements with the current gameweek and the number of started fixtures of their team added
+    """
+    team_fixtures = {}
+    for fixture in fixtures_data:
+        if fixture['started'] or fixture['finished']:
+            for team in [fixture['team_h'], fixture['team_a']]:
+                team_fixtures[team] = team_fixtures.get(team, 0) + 1
+    return [dict(e, event=gw_num, team_fixtures=team_fixtures.get(e['team'], 0)) for e in elements]
+
+def parse_data(season, gw = None, max_workers = 8, requests_per_second = 10, cache_dir = None, offline = False, incremental = False):
     """ 
     Parse and store all the data for a given gw
     Default gw will be latest
     Input gw to alter
+    Player data is fetched on up to max_workers threads, limited to
+    requests_per_second against the FPL api, and written as each player arrives
+    Understat player pages are fetched on the same number of threads
+    Pass cache_dir to keep api responses on disk between runs, and offline
+    to replay a run purely from that cache
+    With incremental, only players whose SNAPSHOT_FIELDS moved since the last
+    scrape are fetched, and their gw.csv only gains the rows that changed.
+    A new gameweek or a new started fixture of their team counts as a move
     """
     if gw != None:
         if type(gw) != int:
             Exception("gw must be integer")
     season = season
     base_filename = 'data/' + season + '/'
+    if cache_dir != None:
+        configure_client(cache = ResponseCache(cache_dir, offline = offline))
     print("Getting data")
     data = get_data()
     print("Parsing summary data")
@@ -39,8 +67,9 @@ def parse_data(season, gw = None):
         gw_num = gw
     print("Cleaning summary data")
     clean_players(base_filename + 'players_raw.csv', base_filename) #write updated summary stats for players to cleaned_players.csv
+    build_player_keys() #give any new players a key in data/player_keys.csv
     print("Getting fixtures data")
-    fixtures(base_filename) #write updated fixtures data to fixtures.csv
+    fixtures_data = fixtures(base_filename) #write updated fixtures data to fixtures.csv
     print("Getting teams data")
     parse_team_data(data["teams"], base_filename) 
     print("Extracting player ids")
@@ -50,10 +79,23 @@ def parse_data(season, gw = None):
     player_base_filename = base_filename + 'players/'
     gw_base_filename = base_filename + 'gws/'
     print("Extracting player specific data")
-    for i,name in player_ids.items():
-        player_data = get_individual_player_data(i)
+    snapshot_players = get_snapshot_players(data["elements"], fixtures_data, gw_num)
+    if incremental:
+        changed_ids = get_changed_player_ids(snapshot_players, base_filename, SNAPSHOT_FIELDS)
+        fetch_ids = [i for i in player_ids.keys() if i in changed_ids]
+        print("Fetching " + str(len(fetch_ids)) + " of " + str(len(player_ids)) + " players")
+    else:
+        fetch_ids = list(player_ids.keys())
+    rate_limiter = RateLimiter(requests_per_second)
+    player_results = fetch_concurrently(get_individual_player_data, fetch_ids, max_workers, rate_limiter, FPL_HOST)
+    for i, player_data in player_results:
+        name = player_ids[i]
         parse_player_history(player_data["history_past"], player_base_filename, name, i)
-        parse_player_gw_history(player_data["history"], player_base_filename, name, i)
+        if incremental:
+            append_player_gw_history(player_data["history"], player_base_filename, name, i)
+        else:
+            parse_player_gw_history(player_data["history"], player_base_filename, name, i)
+    parse_player_snapshot(snapshot_players, base_filename, SNAPSHOT_FIELDS)
     if gw_num > 0:
         print("Writing expected points")
         os.makedirs(gw_base_filename, exist_ok=True)
@@ -67,11 +109,12 @@ def parse_data(season, gw = None):
         print("Merging gw scores")
         merge_gw(gw_num, gw_base_filename)
     understat_filename = base_filename + 'understat'
-    parse_epl_data(understat_filename)
+    parse_epl_data(understat_filename, max_workers)
 
 def fixtures(base_filename):
     data = get_fixtures_data()
     parse_fixtures(data, base_filename)
+    return data
     
 #%%
 def main():
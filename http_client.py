@@ -0,0 +1,144 @@
+import json
+import random
+import threading
+import time
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+class RetryBudget:
+    """ Shared cap on the number of retries a client may spend over its lifetime
+
+    Args:
+        max_retries (int): total retries allowed across all requests, None for no cap
+    """
+    def __init__(self, max_retries=None):
+        self.remaining = max_retries
+        self.lock = threading.Lock()
+
+    def spend(self):
+        """ Take one retry from the budget, returning False if it is exhausted
+        """
+        with self.lock:
+            if self.remaining is None:
+                return True
+            if self.remaining <= 0:
+                return False
+            self.remaining -= 1
+            return True
+
+class HttpClient:
+    """ Pooled keep-alive HTTP client with timeouts and retries
+
+    Failed requests (connection errors, timeouts and retryable status codes) are retried
+    with exponential backoff and full jitter, honouring Retry-After when the server sends it.
+    With a rate limiter attached, a Retry-After pauses all requests to that host rather than just this one.
+
+    Args:
+        timeout (float or tuple): connect/read timeout in seconds passed to requests
+        max_retries (int): retries allowed for a single request
+        backoff_base (float): delay in seconds before the first retry
+        backoff_max (float): upper bound on any single delay in seconds
+        retry_budget (int): retries allowed across all requests made by this client
+        pool_size (int): connections kept open per host
+        rate_limiter (RateLimiter, optional): limiter consulted before every request
+        cache (ResponseCache, optional): response cache used by get_json
+    """
+    def __init__(self, timeout=(5, 30), max_retries=5, backoff_base=1.0, backoff_max=60.0, retry_budget=1000, pool_size=32, rate_limiter=None, cache=None):
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.retry_budget = RetryBudget(retry_budget)
+        self.rate_limiter = rate_limiter
+        self.cache = cache
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def backoff(self, attempt, retry_after=None):
+        """ Seconds to sleep before the given retry attempt
+        """
+        if retry_after is not None:
+            try:
+                return min(float(retry_after), self.backoff_max)
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def get(self, url, headers=None, ok_codes=(200,)):
+        """ GET url, retrying transient failures
+
+        Raises:
+            Exception: the response code was not in ok_codes once retries ran out
+        """
+        host = urlparse(url).netloc
+        attempt = 0
+        while True:
+            if self.rate_limiter is not None:
+                self.rate_limiter.wait(host)
+            retry_after = None
+            try:
+                response = self.session.get(url, headers=headers, timeout=self.timeout)
+                if response.status_code not in RETRY_STATUS_CODES:
+                    break
+                retry_after = response.headers.get('Retry-After')
+                error = Exception("Response was code " + str(response.status_code))
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = e
+            if attempt >= self.max_retries or not self.retry_budget.spend():
+                raise error
+            delay = self.backoff(attempt, retry_after)
+            if retry_after is not None and self.rate_limiter is not None:
+                # the server asked for a pause, so hold back every thread using this host
+                self.rate_limiter.defer(host, delay)
+            else:
+                time.sleep(delay)
+            attempt += 1
+        if response.status_code not in ok_codes:
+            raise Exception("Response was code " + str(response.status_code))
+        return response
+
+    def get_json(self, url):
+        """ GET url and decode the body as json
+
+        With a cache attached, fresh entries are returned without a request and stale ones
+        are revalidated with a conditional GET. In offline mode only the cache is used.
+        """
+        if self.cache is None:
+            return json.loads(self.get(url).text)
+        entry = self.cache.lookup(url)
+        if entry is not None and (entry['fresh'] or self.cache.offline):
+            return json.loads(entry['body'])
+        if self.cache.offline:
+            raise Exception("No cached response for " + url + " in offline mode")
+        response = self.get(url, headers=self.cache.conditional_headers(entry), ok_codes=(200, 304))
+        if response.status_code == 304:
+            self.cache.touch(url)
+            return json.loads(entry['body'])
+        self.cache.store(url, response.content, response.headers.get('ETag'), response.headers.get('Last-Modified'))
+        return json.loads(response.content)
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_client():
+    """ Return the shared client, creating it on first use
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = HttpClient()
+        return _client
+
+def configure_client(**kwargs):
+    """ Replace the shared client with one built from the given HttpClient arguments
+    """
+    global _client
+    with _client_lock:
+        _client = HttpClient(**kwargs)
+        return _client
@@ -3,6 +3,7 @@ import pandas as pd
 import numpy as np
 from os.path import dirname, join
 import os
+from storage import read_table, write_table, write_table_chunks
 
 def import_merged_gw(season='2021-22'):
     """ Function to call merged_gw.csv file in every data/season folder
@@ -25,18 +26,23 @@ def clean_players_name_string(df, col='name'):
     #replace _ with space in name column
     df[col] = df[col].str.replace('_', ' ')
     #remove number in name column
-    df[col] = df[col].str.replace('\d+', '')
+    df[col] = df[col].str.replace(r'\d+', '', regex=True)
     #trim name column
     df[col] = df[col].str.strip()
     return df
 
+def fill_positions(names, positions):
+    """ Fill each player's missing positions forwards and then backwards from their other rows, in row order
+    """
+    filled = positions.groupby(names, observed=True).ffill()
+    return filled.groupby(names, observed=True).bfill()
+
 def filter_players_exist_latest(df, col='position'):
     """ Fill in null 'position' (data that only available in 20-21 season) into previous seasons. 
         Null meaning that player doesnt exist in latest season hence can exclude.
     """
 
-    result = df.groupby('name')[col].apply(lambda x: x.ffill().bfill())
-    df[col] = result.droplevel(0)
+    df[col] = fill_positions(df['name'], df[col])
     df = df[df[col].notnull()]
     return df
 
@@ -60,6 +66,15 @@ def get_opponent_team_name(df):
     df = df.rename(columns={"team_name": "opp_team_name"})
     return df
 
+def get_team_names():
+    """ Team names from master_team_list as {season: {team id: team name}}
+    """
+    path = os.getcwd()
+    filename = 'master_team_list.csv'
+    team_path = join(dirname(dirname("__file__")), path, 'data', filename)
+    df_team = pd.read_csv(team_path)
+    return {season: dict(zip(teams['team'], teams['team_name'])) for season, teams in df_team.groupby('season')}
+
 def export_cleaned_data(df):
     """ Function to export merged df into specified folder
     Args:
@@ -70,5 +85,14 @@ def export_cleaned_data(df):
     path = os.getcwd()
     filename = 'cleaned_merged_seasons.csv'
     filepath = join(dirname(dirname("__file__")), path, 'data', filename)
-    df.to_csv(filepath, encoding = 'utf-8', index=False)
+    write_table(df, filepath, index=False)
     return df
+
+def export_cleaned_chunks(chunks):
+    """ Stream DataFrames from an iterable into the cleaned_merged_seasons.csv file, one at a time
+    """
+
+    path = os.getcwd()
+    filename = 'cleaned_merged_seasons.csv'
+    filepath = join(dirname(dirname("__file__")), path, 'data', filename)
+    write_table_chunks(chunks, filepath)
@@ -2,8 +2,12 @@
 import pandas as pd
 import numpy as np
 import os
-import csv
 import re
+import json
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+from storage import read_table, write_table, append_table
+from player_keys import get_element_keys
 
 pd.set_option('future.no_silent_downcasting', True) #to prevent FutureWarning: Downcasting behaviour in 'replace' is deprecated ...
 
@@ -52,43 +56,74 @@ def get_prev_gw(season, gw):
 
     return (season, gw)
 
-def get_gw_data(season, gw):
+GW_PARAMS = ['gw', 'name', 'position', 'team', 'value', 'total_points', 'xP', 'goals_scored', 'assists', 'goals_conceded', 'expected_goals', 'expected_assists', 'expected_goal_involvements', 'influence', 'creativity', 'threat', 'starts', 'clean_sheets', 'saves','minutes', 'was_home', 'opponent_team']
+LAG_PARAMS = ['name', 'position', 'team', 'value', 'total_points', 'xP', 'goals_scored', 'assists', 'goals_conceded', 'expected_goals', 'expected_assists', 'expected_goal_involvements', 'influence', 'creativity', 'threat', 'starts', 'clean_sheets', 'saves', 'minutes']
+FIXTURE_PARAMS = ['event', 'team_h', 'team_h_difficulty', 'team_a', 'team_a_difficulty']
+
+def read_gw_file(season, gw):
     """
     Summary:
-        reads gw{i} data for a given season and week i, adding 'opponent difficulty' from seperate fixtures.csv file
+        reads the raw gw{i}.csv columns used by the model dataset, with the player_key of each row's element
+    """
+    gw_df = read_table(f'data/{season}/gws/gw{gw}.csv', columns = GW_PARAMS + ['element'])
+    if 'element' in gw_df.columns:
+        gw_df['player_key'] = get_element_keys(season, gw_df['element'], gw_df['name'])
+        gw_df = gw_df.drop(columns = 'element')
+    return gw_df
+
+def get_fixture_difficulties(fixs_df, gws):
+    """
+    Summary:
+        one row per team per fixture in the given gameweeks, with the difficulty of that fixture for the team
+        teams with a double gameweek get two rows, teams with a blank get none
 
     Args:
-        season (str): season in 'YYYY-YY'
-        gw (int): gameweek
+        fixs_df (df): fixtures table with FIXTURE_PARAMS columns
+        gws (list): gameweeks to include
 
     Returns:
-        type(df): cleaned gw dataframe
+        df: 'event', 'team' (id) and 'difficulty' columns
     """
-    season_path = f'data/{season}/'
-    gw_path = season_path + f'gws/'
-    gw_filepath = gw_path + f'gw{gw}.csv'
-    
-    #step 1: get gameweek df
-    gw_df = pd.read_csv(gw_filepath, encoding = 'ISO-8859-1')
+    gw_fixs_df = fixs_df[fixs_df['event'].isin(gws)]
+
+    h_diff = gw_fixs_df.loc[:, ['event', 'team_h', 'team_h_difficulty']].rename(columns = {'team_h':'team', 'team_h_difficulty':'difficulty'})
+    a_diff = gw_fixs_df.loc[:, ['event', 'team_a', 'team_a_difficulty']].rename(columns = {'team_a':'team', 'team_a_difficulty':'difficulty'})
+    return pd.concat([h_diff, a_diff])
+
+def format_gw_data(season, gw, gw_df, fixs_df):
+    """
+    Summary:
+        cleans a raw gameweek table read by read_gw_file, adding 'opponent difficulty' from the season's fixtures
+    """
+    gw_df = gw_df.copy()
+    params = GW_PARAMS + ['player_key']
     gw_df['gw'] = f'{season}-{gw}'
-    params = ['gw', 'name', 'position', 'team', 'value', 'total_points', 'xP', 'goals_scored', 'assists', 'goals_conceded', 'expected_goals', 'expected_assists', 'expected_goal_involvements', 'influence', 'creativity', 'threat', 'starts', 'clean_sheets', 'saves','minutes', 'was_home', 'opponent_team']
     missing_params = [param for param in params if param not in gw_df.columns]
     for col in missing_params:
         gw_df[col] = np.nan
     gw_df = gw_df.loc[:, params]
 
-    #step 2: add opponent difficulty from fixtures.csv to gameweek df
-    fixs_df = pd.read_csv(f'{season_path}fixtures.csv', encoding = 'ISO-8859-1')
-    gw_fixs_df = fixs_df[fixs_df['event'] == gw]
-
-    h_diff = gw_fixs_df.loc[:, ['team_h', 'team_h_difficulty']].rename(columns = {'team_h':'team', 'team_h_difficulty':'difficulty'})
-    a_diff = gw_fixs_df.loc[:, ['team_a', 'team_a_difficulty']].rename(columns = {'team_a':'team', 'team_a_difficulty':'difficulty'})
-    team_diff = pd.concat([h_diff, a_diff]).sort_values('team')
+    team_diff = get_fixture_difficulties(fixs_df, [gw]).loc[:, ['team', 'difficulty']].sort_values('team')
     team_diff = dict(team_diff.values)
     gw_df['opponent_team_difficulty']  = gw_df['opponent_team'].map(team_diff)
     
     return gw_df.reindex(columns = params)
 
+def get_gw_data(season, gw):
+    """
+    Summary:
+        reads gw{i} data for a given season and week i, adding 'opponent difficulty' from seperate fixtures.csv file
+
+    Args:
+        season (str): season in 'YYYY-YY'
+        gw (int): gameweek
+
+    Returns:
+        type(df): cleaned gw dataframe
+    """
+    fixs_df = read_table(f'data/{season}/fixtures.csv', columns = FIXTURE_PARAMS)
+    return format_gw_data(season, gw, read_gw_file(season, gw), fixs_df)
+
 def build_lagged_file_list(season, gw, lags):
     counter = 0
 
@@ -102,160 +137,294 @@ def build_lagged_file_list(season, gw, lags):
             yield gw_path + f'gw{gw}.csv'
             counter += 1
 
-def get_trailing_data(season, gw, lags = 19):
-    """_summary_
+class TrailingWindow:
+    """
+    Summary:
+        sliding window over the last `lags` non-empty gameweeks before a given gameweek, across season boundaries
+        each gameweek file is read once and kept only while it is in the window (or is the current gameweek),
+        so stepping the window one gameweek backwards or forwards only reads the gameweek that enters it
 
     Args:
-        season (_type_): _description_
-        gw (_type_): _description_
-        lags (int, optional): _description_. Defaults to 19.
-
-    Returns:
-        _type_: _description_
+        lags (int, optional): number of non-empty gameweeks in the window. Defaults to 19.
     """
-
-    trailing_gw_filepaths = list(build_lagged_file_list(season, gw, lags))
+    def __init__(self, lags = 19):
+        self.lags = lags
+        self.tables = {} # (season, gw): raw gameweek table, None once a gameweek is known to be empty
+        self.fixtures = {} # season: fixtures table
+        self.window = [] # (season, gw) keys in the window, most recent first
+        self.current = None
+
+    def gw_table(self, season, gw):
+        key = (season, gw)
+        if key not in self.tables:
+            gw_df = read_gw_file(season, gw)
+            self.tables[key] = None if gw_df.empty else gw_df
+        return self.tables[key]
+
+    def get_gw_data(self, season, gw):
+        """ cleaned gameweek dataframe, as returned by get_gw_data
+        """
+        if season not in self.fixtures:
+            self.fixtures[season] = read_table(f'data/{season}/fixtures.csv', columns = FIXTURE_PARAMS)
+        gw_df = self.gw_table(season, gw)
+        if gw_df is None:
+            gw_df = pd.DataFrame(columns = GW_PARAMS[1:])
+        return format_gw_data(season, gw, gw_df, self.fixtures[season])
+
+    def advance(self, season, gw):
+        """ move the window to end just before (season, gw), dropping tables that have left it
+        """
+        window = []
+        key = (season, gw)
+        while len(window) < self.lags:
+            key = get_prev_gw(*key)
+            if self.gw_table(*key) is not None:
+                window += [key]
+        keep = set(window) | {(season, gw)}
+        for old_key in self.window + [self.current]:
+            if old_key not in keep and self.tables.get(old_key) is not None:
+                del self.tables[old_key]
+        self.window = window
+        self.current = (season, gw)
+
+    def lagged_tables(self, season, gw):
+        """ raw tables of the gameweeks in the window before (season, gw), most recent first
+        """
+        self.advance(season, gw)
+        df_list = [self.tables[key] for key in self.window]
+        return [df for df in df_list if not df.isna().all().all()]
+
+    def get_trailing_data(self, season, gw):
+        """ lagged data for the gameweek, as returned by get_trailing_data
+        """
+        df_list = self.lagged_tables(season, gw)
+        # get_trailing_data has always included the most recent gameweek twice, keep that so features don't shift
+        lagged_data_df = pd.concat(df_list[:1] + df_list, axis=0)
+
+        params = LAG_PARAMS + ['player_key']
+        missing_params = [param for param in params if param not in lagged_data_df.columns]
+        for col in missing_params:
+            lagged_data_df[col] = np.nan
     
-    df_list = [pd.read_csv(filepath, encoding = 'ISO-8859-1') for filepath in trailing_gw_filepaths]
+        return lagged_data_df.loc[:, params].reindex(columns = params)
 
-    # make sure the first df in the list isn't empty
-    i = 0 # counter for index location of first non-empty df
-    for df in df_list:
-        if df.empty == False:
-            lagged_data_df = df
-            break
-        else:
-            i += 1
-    
-    for df in df_list[i:]:
-        if df.empty or df.isna().all().all():
-            continue
-        lagged_data_df = pd.concat([lagged_data_df, df], axis=0)
-
-    lag_params = ['name', 'position', 'team', 'value', 'total_points', 'xP', 'goals_scored', 'assists', 'goals_conceded', 'expected_goals', 'expected_assists', 'expected_goal_involvements', 'influence', 'creativity', 'threat', 'starts', 'clean_sheets', 'saves', 'minutes']
-    
-    missing_params = [param for param in lag_params if param not in lagged_data_df.columns]
-    for col in missing_params:
-        lagged_data_df[col] = np.nan
-    
-    return lagged_data_df.loc[:, lag_params].reindex(columns = lag_params)             
-    
-def combine_gw_trailing(gw_data, trailing_data):
-    """_summary_
+def get_trailing_data(season, gw, lags = 19):
+    """
+    Summary:
+        reads the lagged data for the `lags` non-empty gameweeks before a given gameweek
 
     Args:
-        gw_data (_type_): _description_
-        trailing_data (_type_): _description_
+        season (str): season in 'YYYY-YY'
+        gw (int): gameweek
+        lags (int, optional): number of non-empty gameweeks to lag. Defaults to 19.
 
     Returns:
-        _type_: _description_
+        df: lagged data, most recent gameweek first
     """
-    players = list(set(gw_data['name']))
+    return TrailingWindow(lags).get_trailing_data(season, gw)
     
-    # ensure elements in the 'name' columns are fomatted the same 
-    # season 2019-20 and before names = 'First_Second_i' vs 'First Second' afterwards
-    # ==> since players is derived from gw_data, searching for each player in players will return null from trailing_data
-    trailing_data['name'] = trailing_data['name'].str.replace(r'[\d]+', '', regex=True).str.replace('_', ' ').str.strip()
-
- 
-    for player in players:
-        
-        gw_player_data = gw_data[gw_data['name'] == player]
-        player_rows = gw_player_data.shape[0]
-        
-        if player_rows == 0 or player_rows > 2:
-            continue
-
-        elif player_rows == 2: # some gw have teams play twice, recalculate lag data accordingly
-#            print(player, player_rows)
-            lagged_data_to_input = gw_player_data.iloc[0, 4:19].to_frame().T
-            first_gw_match_lagged_player_data = trailing_data[trailing_data['name']==player].loc[:, 'total_points':'minutes']
-            second_gw_match_lagged_player_data = pd.concat([lagged_data_to_input, first_gw_match_lagged_player_data.iloc[:-1]])
-            aggregated_first = first_gw_match_lagged_player_data.sum().to_frame().T
-            aggregated_second = second_gw_match_lagged_player_data.sum().to_frame().T
-            agg_lagged_player_data = pd.concat([aggregated_first, aggregated_second], axis=0)
-            agg_lagged_player_data['minutes'] = agg_lagged_player_data['minutes'].replace([0], np.nan)
-            agg_lagged_player_data_90 = agg_lagged_player_data.iloc[:, :-1].div(agg_lagged_player_data.iloc[:, -1], axis = 0)
-            
-        else:
-#            print(player, player_rows)
-            agg_lagged_player_data = trailing_data[trailing_data['name']==player].loc[:, 'total_points':'minutes'].sum().to_frame().T
-            agg_lagged_player_data['minutes'] = agg_lagged_player_data['minutes'].replace([0], np.nan)
-            agg_lagged_player_data_90 = agg_lagged_player_data.iloc[:, :-1].div(agg_lagged_player_data.iloc[:, -1], axis=0)
-
-        agg_lagged_player_data.replace([np.inf, -np.inf], np.nan, inplace=True)
-
-        n = trailing_data[trailing_data['name']==player].shape[0]
-        if n > 0:
-            agg_lagged_player_data_90['minutes'] = agg_lagged_player_data['minutes'] / n
-        else:
-            agg_lagged_player_data_90['minutes'] = 0
-
-        agg_lagged_player_data_90.columns = 'tr_' + agg_lagged_player_data_90.columns
-        agg_lagged_player_data_90.index = gw_player_data.index
-
-        if agg_lagged_player_data_90.isna().all().all(): #concatenating empty or #NA dfs will soon be discontinued, this line ensures the code will continue to run then
-            continue
+def combine_gw_trailing(gw_data, trailing_data):
+    """
+    Summary:
+        adds the trailing per-90 'tr_*' aggregates to every row of a gameweek, computed for all players at once
+        with groupby sums over the trailing table
 
-        player_model_data = pd.concat([gw_player_data, agg_lagged_player_data_90], axis = 1)
+        players with two fixtures in the gameweek are treated as before:
+            - first fixture: tr_* stats are blank, tr_minutes covers the full trailing window
+            - second fixture: the trailing window drops its oldest row and takes the first fixture's stats instead,
+              and the tr_* stats are divided by the first fixture's value rather than by minutes
+        players with more than two fixtures, or whose tr_* columns are all blank, are left out
 
-        try:
-            combined_data = pd.concat([player_model_data, combined_data], axis = 0)
-        except NameError:
-            combined_data = player_model_data
+    Args:
+        gw_data (df): gameweek data from get_gw_data
+        trailing_data (df): lagged data from get_trailing_data, most recent gameweek first
 
+    Returns:
+        df: gw_data rows with tr_* columns added
+    """
+    # names change form between seasons and are shared by different players, so players are matched on player_key
+    trailing_keys = trailing_data['player_key']
+    gw_keys = gw_data['player_key']
+
+    stats = list(trailing_data.loc[:, 'total_points':'minutes'].columns)
+    per_90_stats = stats[:-1]
+
+    trailing_stats = trailing_data.loc[:, stats].set_axis(trailing_keys.values).rename_axis('player_key')
+    for col in stats:
+        trailing_stats[col] = pd.to_numeric(trailing_stats[col], errors='coerce')
+    grouped = trailing_stats.groupby('player_key', sort=False)
+    sums = grouped[stats].sum()
+    counts = grouped.size()
+    oldest = grouped.tail(1)[stats].fillna(0)
+
+    fixtures_per_player = gw_keys.groupby(gw_keys).transform('size')
+    gw_data = gw_data[fixtures_per_player <= 2]
+    keys = gw_keys[gw_data.index]
+    fixtures_per_player = fixtures_per_player[gw_data.index]
+    fixture_number = keys.groupby(keys).cumcount()
+
+    player_sums = sums.reindex(keys).fillna(0).set_axis(gw_data.index)
+    n = counts.reindex(keys).fillna(0).set_axis(gw_data.index)
+
+    # second fixture of a double gameweek: swap the oldest trailing row for the first fixture
+    first = (fixtures_per_player == 2) & (fixture_number == 0)
+    first_fixture = gw_data[first].set_axis(keys[first].values)
+    first_fixture_stats = first_fixture[stats[:-1]].apply(pd.to_numeric, errors='coerce').fillna(0)
+    first_fixture_stats['minutes'] = 0
+    second = (fixtures_per_player == 2) & (fixture_number == 1)
+    second_keys = keys[second]
+    player_sums.loc[second] = (
+        player_sums.loc[second].values
+        - oldest.reindex(second_keys).fillna(0).values
+        + first_fixture_stats.reindex(second_keys).values
+        )
+
+    minutes = player_sums['minutes'].replace([0], np.nan)
+    divisor = minutes.copy()
+    divisor[second] = pd.to_numeric(first_fixture['value'], errors='coerce').fillna(0).reindex(second_keys).values
+    divisor[first] = np.nan
+
+    tr_data = player_sums[per_90_stats].div(divisor, axis=0)
+    tr_data['minutes'] = (minutes / n).where(n > 0, 0)
+    tr_data.columns = 'tr_' + tr_data.columns
+
+    blank = tr_data.isna().all(axis=1).groupby(keys).transform('all')
+    
+    return pd.concat([gw_data.drop(columns = 'player_key'), tr_data], axis=1)[~blank]
 
-    return combined_data
+def read_gw_manifest(season):
+    """
+    Summary:
+        content hash and row count of every gw{i}.csv in a season's gws folder
 
-def update_current_season_dataset():
+    Returns:
+        dic: {gw: {'hash': sha1 of file, 'rows': number of data rows}}
+    """
+    gw_path = f'data/{season}/gws/'
+    pattern = r'^gw(\d+)\.csv$' # regex to match any file with 'gw*.csv'
+    manifest = {}
+    for filename in os.listdir(gw_path):
+        match = re.match(pattern, filename)
+        if match:
+            with open(gw_path + filename, 'rb') as file:
+                content = file.read()
+            manifest[int(match.group(1))] = {'hash': hashlib.sha1(content).hexdigest(), 'rows': max(len(content.splitlines()) - 1, 0)}
+    return manifest
+
+def write_gw_manifest(manifest_path, gw_manifest):
+    with open(manifest_path, 'w') as file:
+        json.dump({str(gw): gw_manifest[gw] for gw in sorted(gw_manifest)}, file, indent = 1)
+
+def get_affected_gws(gw_manifest, changed_gws, lags):
+    """
+    Summary:
+        gameweeks whose model data depends on any of changed_gws: the changed gameweeks themselves
+        plus every later gameweek of the season whose trailing window contains one of them
+    """
+    affected = set(changed_gws)
+    non_empty = sorted(gw for gw, entry in gw_manifest.items() if entry['rows'] > 0)
+    for gw in gw_manifest:
+        window = [lagged for lagged in non_empty if lagged < gw][-lags:]
+        if any(lagged in changed_gws for lagged in window):
+            affected.add(gw)
+    return affected
+
+def update_current_season_dataset(season = '2024-25', lags = 19):
     '''
     Summary:
-        updates model_data.csv in the 2024-25 season folder with latest data from the gw folders
+        updates model_data.csv in the season folder with latest data from the gw folders
         NB can only update model_data.csv to be as current as the gw folder
+
+        processed gameweeks are tracked in model_data_manifest.json with the hash of the gw{i}.csv they were built from
+        new gameweeks are computed and appended; a gameweek whose file has changed since is recomputed together with
+        the later gameweeks whose trailing window includes it, and their rows are replaced
     '''
-    
-    season = '2024-25'
     filepath = f'data/{season}/model_data.csv'
-    pattern = r'^gw\d+\.csv$' # regex to match any file with 'gw*.csv'
+    manifest_path = f'data/{season}/model_data_manifest.json'
 
-    if not os.path.exists(filepath): #if model_data doesn't exist, create it
-        with open(filepath, 'w', newline='') as file:
-            writer = csv.writer(file)
     try:
-        model_data = pd.read_csv(filepath, index_col=0)
-    except pd.errors.EmptyDataError:
+        model_data = read_table(filepath, index_col=0)
+    except (FileNotFoundError, pd.errors.EmptyDataError):
         model_data = pd.DataFrame()  # Initialize an empty DataFrame
-    
-    #number of gw csv files already downloaded
-    gw_folder_contents = os.listdir(f'data/{season}/gws')
-    gw_files = [filename for filename in gw_folder_contents if re.match(pattern, filename)]
-    gw_count = len(gw_files)
-    
-    finish = gw_count
 
-    if model_data.empty:
-        start = 0
-    else:
-        gws_already_saved = len(model_data.groupby('gw').last())
-        start = gw_count - gws_already_saved
-        if gw_count == gws_already_saved:
-            print(f'gw model data uptodate. Latest gw = {gw_count}; gws already saved = {gws_already_saved}.')
-            return
-        
-    for i in range(start + 1, finish + 1):
-        gw_df = get_gw_data(season, i)
-        trailing_df = get_trailing_data(season, i)
-        comb = combine_gw_trailing(gw_df, trailing_df)
-        
-        if model_data.empty:
-            model_data = comb
+    gw_manifest = read_gw_manifest(season)
+    if os.path.exists(manifest_path):
+        with open(manifest_path, 'r') as file:
+            processed = {int(gw): entry for gw, entry in json.load(file).items()}
+    elif model_data.empty:
+        processed = {}
+    else: # model_data built before the manifest existed, trust the gameweeks it already holds
+        saved_gws = set(int(label.split('-')[-1]) for label in model_data['gw'].unique())
+        processed = {gw: entry for gw, entry in gw_manifest.items() if gw in saved_gws}
+
+    new_gws = set(gw_manifest) - set(processed)
+    changed_gws = set(gw for gw in processed if gw in gw_manifest and processed[gw]['hash'] != gw_manifest[gw]['hash'])
+    if len(new_gws) == 0 and len(changed_gws) == 0:
+        if not os.path.exists(manifest_path):
+            write_gw_manifest(manifest_path, gw_manifest)
+        print(f'gw model data uptodate. Latest gw = {max(gw_manifest, default=0)}; gws already saved = {len(processed)}.')
+        return
+
+    to_compute = sorted(new_gws | get_affected_gws(gw_manifest, changed_gws, lags))
+    window = TrailingWindow(lags)
+    frames = []
+    for gw in to_compute:
+        gw_df = window.get_gw_data(season, gw)
+        if gw_df.empty:
+            continue
+        trailing_df = window.get_trailing_data(season, gw)
+        frames += [combine_gw_trailing(gw_df, trailing_df)]
+
+    if len(frames) > 0:
+        comb = pd.concat(frames, axis = 0)
+        if len(changed_gws) == 0 and not model_data.empty and min(new_gws) > max(processed):
+            append_table(comb.reindex(columns = model_data.columns), filepath)
         else:
+            recomputed = [f'{season}-{gw}' for gw in to_compute]
+            if not model_data.empty:
+                model_data = model_data[~model_data['gw'].isin(recomputed)]
             model_data = pd.concat([model_data, comb], axis = 0)
-    
-    model_data.to_csv(filepath)
-    print(f'Model data updated with {finish-start} new gws to gw{finish}, season {season}')
+            gw_order = model_data['gw'].str.split('-').str[-1].astype(int)
+            model_data = model_data.iloc[np.argsort(gw_order.values, kind = 'stable')]
+            write_table(model_data, filepath)
+
+    write_gw_manifest(manifest_path, gw_manifest)
+    print(f'Model data updated with {len(to_compute)} gws ({len(new_gws)} new, {len(to_compute) - len(new_gws)} recomputed), season {season}')
     return    
 
+def build_gw_range(season, first_gw, last_gw, lags = 19):
+    """
+    Summary:
+        builds the model data rows for gameweeks first_gw to last_gw of a season
+        gameweeks are compiled latest first so one trailing window slides back through the range
+
+    Args:
+        season (str): season in 'YYYY-YY'
+        first_gw (int): first gameweek of the range
+        last_gw (int): last gameweek of the range
+        lags (int, optional): lags to use in calculation of trailing data. Defaults to 19.
+
+    Returns:
+        df: model data for the range in ascending gameweek order, None if no gameweek could be built
+    """
+    window = TrailingWindow(lags)
+    frames = []
+    for gw in range(last_gw, first_gw - 1, -1):
+        print(f'compiling data for gameweek {gw}, season {season}')
+        try:
+            gw_df = window.get_gw_data(season, gw)
+            if gw_df.empty:
+                continue
+            trailing_df = window.get_trailing_data(season, gw)
+        except FileNotFoundError as e:
+            print(f'Terminated at gameweek: {gw}; season: {season}; because: {e}')
+            break
+        frames = [combine_gw_trailing(gw_df, trailing_df)] + frames
+
+    if len(frames) == 0:
+        return None
+    return pd.concat(frames, axis=0)
+
 def generate_full_season_dataset(starting_season, seasons_to_run = 1, lags_for_trailing_data = 19):
     """ Creates and stores all player all season datbase in model_data.csv for as many seasons to run as input, 
         Stores in model_data.csv in each season's folder
@@ -268,37 +437,49 @@ def generate_full_season_dataset(starting_season, seasons_to_run = 1, lags_for_t
         
     """
     season = starting_season
-    gw = get_runs(season) 
-    seasons_to_run = seasons_to_run
 
     for i in range(seasons_to_run): # required data unavailable in season 2017-18 and prior; last full season the code will run for is 2018-19
+        model_data = build_gw_range(season, 1, get_runs(season), lags_for_trailing_data)
+        if model_data is not None:
+            write_table(model_data, f'data/{season}/model_data.csv')
+        season = get_prev_season(season)
+    print('Data gathering complete')
 
-        runs = get_runs(season)
-        lags = lags_for_trailing_data
+def split_gw_ranges(season, chunks):
+    """
+    Summary:
+        splits a season's gameweeks into `chunks` contiguous (first_gw, last_gw) ranges
+    """
+    runs = get_runs(season)
+    bounds = np.linspace(0, runs, chunks + 1).round().astype(int)
+    return [(int(bounds[i]) + 1, int(bounds[i + 1])) for i in range(chunks) if bounds[i + 1] > bounds[i]]
 
-        path = f'data/{season}/'
-        
-        for i in range(runs):
-            print(f'compiling data for gameweek {gw}, season {season}')
-            try:
-                gw_df = get_gw_data(season, gw)
-                if gw_df.empty:
-                    season, gw = get_prev_gw(season, gw)
-                    continue
-                trailing_df = get_trailing_data(season, gw, lags)
-            except FileNotFoundError as e:
-                print(f'Terminated at gameweek: {gw}; season: {season}; because: {e}')
-                break
-
-            comb = combine_gw_trailing(gw_df, trailing_df)
-            
-            if i == 0:
-                model_data = comb
-            model_data = pd.concat([comb, model_data], axis=0)
-            
-            season, gw = get_prev_gw(season, gw)
-        
-        model_data.to_csv(f'{path}model_data.csv')
+def generate_model_datasets(seasons, lags_for_trailing_data = 19, max_workers = None, chunks_per_season = 1):
+    """
+    Summary:
+        builds model_data.csv for several seasons on a process pool
+        with chunks_per_season = 1 each worker builds and writes one season's model_data.csv,
+        otherwise seasons are split into gameweek ranges and the driver stitches each season back together in gameweek order
+        the gameweek files are only ever read, so workers share them without coordination
+
+    Args:
+        seasons (list): seasons in 'YYYY-YY'
+        lags_for_trailing_data (int, optional): lags to use in calculation of trailing data. Defaults to 19.
+        max_workers (int, optional): number of worker processes. Defaults to the number of cpus.
+        chunks_per_season (int, optional): number of gameweek ranges each season is split into. Defaults to 1.
+    """
+    with ProcessPoolExecutor(max_workers = max_workers) as executor:
+        if chunks_per_season == 1:
+            list(executor.map(generate_full_season_dataset, seasons, [1] * len(seasons), [lags_for_trailing_data] * len(seasons)))
+            return
+
+        tasks = [(season, first_gw, last_gw) for season in seasons for first_gw, last_gw in split_gw_ranges(season, chunks_per_season)]
+        futures = [executor.submit(build_gw_range, season, first_gw, last_gw, lags_for_trailing_data) for season, first_gw, last_gw in tasks]
+        for season in seasons:
+            frames = [future.result() for task, future in zip(tasks, futures) if task[0] == season]
+            frames = [frame for frame in frames if frame is not None]
+            if len(frames) > 0:
+                write_table(pd.concat(frames, axis=0), f'data/{season}/model_data.csv')
     print('Data gathering complete')
 
 
@@ -1,4 +1,7 @@
+import numpy as np
 import pandas as pd
+from storage import read_table
+from collector import get_gw_files
 
 dataPath = 'data/'
 
@@ -28,7 +31,7 @@ goalsConcededMap = {'FWD': {'GKP': -1, 'DEF': -1, 'MID': 0, 'FWD': 0},
 
 
 def getGw(seasonString, gwInt):
-    return pd.read_csv(f'{dataPath}{seasonString}/gws/gw{gwInt}.csv')
+    return read_table(f'{dataPath}{seasonString}/gws/gw{gwInt}.csv')
 
 
 def getGwFixtures(playerID, df):
@@ -82,11 +85,93 @@ def recalculateTotalPoints(seasonString, playerID, newPos):
     return {'old': oldPoints, 'new': newPoints, }
 
 
+seasonColumns = ['element', 'name', 'position', 'fixture', 'total_points', 'bonus', 'bps', 'clean_sheets', 'goals_scored', 'goals_conceded']
+positions = ['GKP', 'DEF', 'MID', 'FWD']
+
+
+def loadSeason(seasonString):
+    """ Every gwN.csv of a season in one table, with 'GK' positions written as 'GKP' to match the maps
+    """
+    gwFiles = get_gw_files(f'{dataPath}{seasonString}/gws')
+    df = pd.concat([read_table(gwFiles[gw], columns=seasonColumns) for gw in sorted(gwFiles)], ignore_index=True)
+    df['position'] = df['position'].replace('GK', 'GKP')
+    return df
+
+
+def mapDelta(oldPositions, newPos, deltaMap):
+    return oldPositions.map({oldPos: deltaMap[oldPos][newPos] for oldPos in deltaMap}).to_numpy()
+
+
+def othersTopBps(df):
+    """ Second and third highest bps among the other players in each row's fixture, -inf where there are too few
+    """
+    ranked = df.sort_values(['fixture', 'bps'], ascending=[True, False])
+    ranked['place'] = ranked.groupby('fixture').cumcount()
+    top = ranked[ranked['place'] < 4].pivot(index='fixture', columns='place', values='bps').reindex(columns=range(4))
+    top = top.astype(float).fillna(-np.inf).reindex(df['fixture']).to_numpy()
+    bps = df['bps'].to_numpy(dtype=float)
+    # drop one copy of the player's own bps from the fixture's top four
+    ownPlace = np.where(bps == top[:, 0], 0, np.where(bps == top[:, 1], 1, np.where(bps == top[:, 2], 2, 3)))
+    o2 = np.where(ownPlace <= 1, top[:, 2], top[:, 1])
+    o3 = np.where(ownPlace <= 2, top[:, 3], top[:, 2])
+    return o2, o3
+
+
+def recalculateBonusDelta(df, newBps, o2, o3):
+    """ Change in bonus when a player's bps becomes newBps and everyone else in the fixture is unchanged
+
+    Matches recalculateFixtureBonus: bonus is the player's 'max' rank within nlargest(3, keep='all'),
+    and a player who drops out of the top three keeps their old bonus.
+    """
+    # lowest bps that stays in the top three once the player's new bps is included
+    threshold = np.minimum(np.maximum(newBps, o3), o2)
+    fixtureCode = pd.factorize(df['fixture'])[0].astype(float)
+    scale = 4 * (np.abs(df['bps']).max() + np.abs(newBps).max() + 1)
+    keys = np.sort(fixtureCode * scale + df['bps'].to_numpy(dtype=float))
+    low = fixtureCode * scale + np.maximum(threshold, -scale / 2)
+    high = fixtureCode * scale + newBps
+    others = np.searchsorted(keys, high, side='right') - np.searchsorted(keys, low, side='left')
+    bps = df['bps'].to_numpy(dtype=float)
+    others = others - ((bps >= threshold) & (bps <= newBps))
+    return np.where(newBps >= threshold, others + 1 - df['bonus'].to_numpy(), 0)
+
+
+def recalculateAllPositions(seasonString, df=None):
+    """ Old and new season points for every player in every position, in one pass over the season
+
+    Applies the same point and bps maps as recalculateFixturePoints, as vectorised deltas per fixture row.
+    A player's points in their own position are their actual points.
+
+    Args:
+        seasonString (str): season in 'YYYY-YY'
+        df (DataFrame, optional): the season as returned by loadSeason, loaded if not given
+
+    Returns:
+        DataFrame: indexed by element with 'name', 'position', 'old' and a new points column per position
+    """
+    if df is None:
+        df = loadSeason(seasonString)
+    oldPositions = df['position']
+    o2, o3 = othersTopBps(df)
+
+    results = df.groupby('element').agg(name=('name', 'last'), position=('position', 'last'), old=('total_points', 'sum'))
+    for newPos in positions:
+        newBps = (df['bps'].to_numpy(dtype=float)
+                  + df['clean_sheets'].to_numpy() * mapDelta(oldPositions, newPos, cleanSheetBpsMap)
+                  + df['goals_scored'].to_numpy() * mapDelta(oldPositions, newPos, scoringBpsMap))
+        points = (df['total_points'].to_numpy()
+                  + df['clean_sheets'].to_numpy() * mapDelta(oldPositions, newPos, cleanSheetMap)
+                  + df['goals_scored'].to_numpy() * mapDelta(oldPositions, newPos, scoringMap)
+                  + (df['goals_conceded'].to_numpy() // 2) * mapDelta(oldPositions, newPos, goalsConcededMap)
+                  + recalculateBonusDelta(df, newBps, o2, o3))
+        points = np.where(oldPositions == newPos, df['total_points'].to_numpy(), points)
+        results[newPos] = pd.Series(points, index=df.index).groupby(df['element']).sum()
+    return results
+
+
 if __name__ == "__main__":
-    print(f"Salah (MID to FWD): {recalculateTotalPoints(seasonString='2021-22', playerID=233, newPos='FWD')}")
-    print(f"Jota (MID to FWD): {recalculateTotalPoints(seasonString='2021-22', playerID=240, newPos='FWD')}")
-    print(f"Havertz (MID to FWD): {recalculateTotalPoints(seasonString='2021-22', playerID=141, newPos='FWD')}")
-    print(f"Dallas (MID to DEF): {recalculateTotalPoints(seasonString='2021-22', playerID=188, newPos='DEF')}")
-    print(f"Joelinton (FWD to MID): {recalculateTotalPoints(seasonString='2021-22', playerID=310, newPos='MID')}")
-    print(f"Saint-Maximan (FWD to MID): {recalculateTotalPoints(seasonString='2021-22', playerID=307, newPos='MID')}")
-    print(f"Kouyate (DEF to MID): {recalculateTotalPoints(seasonString='2021-22', playerID=150, newPos='MID')}")
+    season = recalculateAllPositions('2021-22')
+    for label, playerID, newPos in [('Salah (MID to FWD)', 233, 'FWD'), ('Jota (MID to FWD)', 240, 'FWD'), ('Havertz (MID to FWD)', 141, 'FWD'),
+                                    ('Dallas (MID to DEF)', 188, 'DEF'), ('Joelinton (FWD to MID)', 310, 'MID'),
+                                    ('Saint-Maximan (FWD to MID)', 307, 'MID'), ('Kouyate (DEF to MID)', 150, 'MID')]:
+        print(f"{label}: {{'old': {season.loc[playerID, 'old']}, 'new': {season.loc[playerID, newPos]}}}")
@@ -63,6 +63,53 @@ def parse_player_gw_history(list_of_gw, base_filename, player_name, Id):
         for gw in list_of_gw:
             w.writerow(gw)
 
+def append_player_gw_history(list_of_gw, base_filename, player_name, Id):
+    """ Bring a player's gw.csv up to date without rewriting rows that haven't changed
+
+    Rows already on disk are compared with the fetched ones in order. The file is cut
+    back to the first row that differs and only the rows from there on are written,
+    so a new gameweek is a plain append. A changed header falls back to a full rewrite.
+    """
+    filename = base_filename + player_name + '_' + str(Id) + '/gw.csv'
+    if len(list_of_gw) == 0:
+        return
+    stat_names = sorted(extract_stat_names(list_of_gw[0]))
+    if not os.path.exists(filename):
+        parse_player_gw_history(list_of_gw, base_filename, player_name, Id)
+        return
+    with open(filename, 'r', encoding='utf8', newline='') as f:
+        lines = f.readlines()
+    if len(lines) == 0 or next(csv.reader(lines[:1])) != stat_names:
+        parse_player_gw_history(list_of_gw, base_filename, player_name, Id)
+        return
+    offset = len(lines[0].encode('utf8'))
+    i = 0
+    for line, gw in zip(lines[1:], list_of_gw):
+        row = next(csv.reader([line]))
+        if row != ['' if gw[k] is None else str(gw[k]) for k in stat_names]:
+            break
+        offset += len(line.encode('utf8'))
+        i += 1
+    if i == len(list_of_gw) and i == len(lines) - 1:
+        return
+    with open(filename, 'r+', encoding='utf8', newline='') as f:
+        f.seek(offset)
+        f.truncate()
+        w = csv.DictWriter(f, stat_names)
+        for gw in list_of_gw[i:]:
+            w.writerow(gw)
+
+def parse_player_snapshot(list_of_players, base_filename, fields):
+    """ Store the fields used to detect which players changed since the last scrape
+    """
+    filename = base_filename + 'player_snapshot.csv'
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    with open(filename, 'w+', encoding='utf8', newline='') as f:
+        w = csv.DictWriter(f, ['id'] + fields, extrasaction='ignore')
+        w.writeheader()
+        for player in list_of_players:
+            w.writerow(player)
+
 def parse_gw_entry_history(data, outfile_base):
     for gw in data:
         picks = gw['picks']
@@ -0,0 +1,227 @@
+import os
+import re
+import html
+import unicodedata
+import numpy as np
+import pandas as pd
+from storage import read_csv, write_table
+
+# resolves understat and fbref players to FPL ids
+#   names are accent folded and lower cased, candidates are blocked by team and scored on
+#   trigram overlap of the full names plus how many of their words appear in the FPL names,
+#   with a small bonus for a compatible position. Pairs are assigned one-to-one, best score first.
+#   Players left over (eg transferred mid-season) are then matched across all teams at a stricter threshold.
+# manual fixes live in data/<season>/id_overrides.csv (source, source_id, fpl_id) and always win,
+# an fpl_id of -1 marks a player that should stay unmatched
+
+MATCH_THRESHOLD = 0.55
+UNBLOCKED_THRESHOLD = 0.75
+POSITION_BONUS = 0.1
+
+# letters NFKD does not decompose into a base letter plus accent
+FOLD = str.maketrans({'ø': 'o', 'Ø': 'O', 'æ': 'ae', 'Æ': 'AE', 'ß': 'ss', 'ł': 'l', 'Ł': 'L', 'đ': 'd', 'Đ': 'D', 'ı': 'i', 'œ': 'oe', 'ð': 'd', 'Ð': 'D', 'þ': 'th', 'Þ': 'TH'})
+
+TEAM_ALIASES = {
+    'man city': 'mancity', 'manchester city': 'mancity',
+    'man utd': 'manutd', 'manchester utd': 'manutd', 'manchester united': 'manutd',
+    'sheffield utd': 'sheffieldutd', 'sheffield united': 'sheffieldutd',
+    'spurs': 'tottenham', 'tottenham hotspur': 'tottenham',
+    'wolverhampton wanderers': 'wolves',
+    'nott m forest': 'nottingham forest', 'nott ham forest': 'nottingham forest',
+    'west bromwich albion': 'west brom',
+    'brighton and hove albion': 'brighton', 'brighton hove albion': 'brighton',
+}
+TEAM_SUFFIXES = {'city', 'united', 'utd', 'town', 'fc', 'afc', 'hotspur', 'albion', 'wanderers'}
+
+# position codes of each source as FPL positions
+FPL_POSITIONS = {1: 'GK', 2: 'DEF', 3: 'MID', 4: 'FWD'}
+SOURCE_POSITIONS = {'GK': 'GK', 'D': 'DEF', 'DF': 'DEF', 'M': 'MID', 'MF': 'MID', 'F': 'FWD', 'FW': 'FWD'}
+
+def normalise_name(name):
+    """ Accent-folded, lower case name with punctuation turned into single spaces
+    """
+    name = unicodedata.normalize('NFKD', html.unescape(str(name)).translate(FOLD))
+    name = ''.join(c for c in name if not unicodedata.combining(c)).lower()
+    return ' '.join(re.sub(r'[^a-z0-9]+', ' ', name).split())
+
+def team_key(team):
+    key = TEAM_ALIASES.get(normalise_name(team), normalise_name(team))
+    return ' '.join(word for word in key.split() if word not in TEAM_SUFFIXES) or key
+
+def get_positions(position):
+    """ Set of FPL positions from a source's position string, eg 'F M S' or 'FW,MF'
+    """
+    return {SOURCE_POSITIONS[code] for code in re.split(r'[\s,]+', str(position)) if code in SOURCE_POSITIONS}
+
+def trigrams(name):
+    padded = '  ' + name + ' '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def word_overlap(words, others):
+    """ Share of others found in words, where an initial ('j') matches any word it starts
+    and a short form of four or more letters ('rodri') matches the longer word
+    """
+    found = 0
+    for other in others:
+        found += any(word == other or (len(word) == 1 and other.startswith(word)) or (len(other) >= 4 and word.startswith(other)) for word in words)
+    return found / max(len(others), 1)
+
+def score_pairs(fpl, other):
+    """ Match scores for every FPL x other player pair, as a dense (len(fpl), len(other)) array
+
+    Both frames need 'key' (normalised full name) and 'positions'; fpl also needs 'web_key'.
+    """
+    fpl_grams = [trigrams(key) for key in fpl['key']]
+    other_grams = [trigrams(key) for key in other['key']]
+    vocab = {gram: i for i, gram in enumerate(set().union(*fpl_grams, *other_grams))}
+    a = np.zeros((len(fpl), len(vocab)), dtype=np.float32)
+    b = np.zeros((len(other), len(vocab)), dtype=np.float32)
+    for i, grams in enumerate(fpl_grams):
+        a[i, [vocab[g] for g in grams]] = 1
+    for j, grams in enumerate(other_grams):
+        b[j, [vocab[g] for g in grams]] = 1
+    dice = 2 * (a @ b.T) / (a.sum(axis=1)[:, None] + b.sum(axis=1)[None, :])
+
+    fpl_words = [set(key.split()) for key in fpl['key']]
+    web_words = [set(key.split()) for key in fpl['web_key']]
+    other_words = [set(key.split()) for key in other['key']]
+    contained = np.array([[word_overlap(f | w, o) for o in other_words] for f, w in zip(fpl_words, web_words)])
+    web = np.array([[word_overlap(o, w) for o in other_words] for w in web_words])
+    positions = np.array([[len(f & o) > 0 for o in other['positions']] for f in fpl['positions']])
+
+    return 0.4 * dice + 0.3 * contained + 0.3 * web + POSITION_BONUS * positions
+
+def assign(scores, threshold):
+    """ One-to-one (row, column, score) assignments, taking the best remaining pair first
+    """
+    rows, cols = np.where(scores >= threshold)
+    order = np.argsort(-scores[rows, cols], kind='stable')
+    used_rows, used_cols, pairs = set(), set(), []
+    for i, j in zip(rows[order], cols[order]):
+        if i in used_rows or j in used_cols:
+            continue
+        used_rows.add(i)
+        used_cols.add(j)
+        pairs += [(i, j, scores[i, j])]
+    return pairs
+
+def resolve(fpl, other, overrides=None):
+    """ Match another source's players to FPL players
+
+    Args:
+        fpl (DataFrame): 'id', 'name', 'web_name', 'team' and 'position' (FPL position) columns
+        other (DataFrame): 'id', 'name', 'team' (comma separated if several) and 'position' columns
+        overrides (dict, optional): {other id: fpl id}, fpl id -1 to leave unmatched
+
+    Returns:
+        DataFrame: 'id' (other), 'fpl_id' and 'score' (1 for overrides) for every matched player
+    """
+    fpl = fpl.reset_index(drop=True).assign(
+        key=fpl['name'].map(normalise_name).values,
+        web_key=fpl['web_name'].map(normalise_name).values,
+        positions=[{p} for p in fpl['position']],
+        teams=[{team_key(fpl_team)} for fpl_team in fpl['team']])
+    other = other.reset_index(drop=True).assign(
+        key=other['name'].map(normalise_name).values,
+        positions=other['position'].map(get_positions).values,
+        teams=[{team_key(t) for t in str(teams).split(',')} for teams in other['team']])
+
+    matches = []
+    overrides = {str(k): int(v) for k, v in (overrides or {}).items()}
+    fixed = other['id'].astype(str).isin(overrides.keys())
+    for other_id in other.loc[fixed, 'id']:
+        if overrides[str(other_id)] != -1:
+            matches += [(other_id, overrides[str(other_id)], 1.0)]
+    free_fpl = ~fpl['id'].isin([fpl_id for _, fpl_id, _ in matches])
+    free_other = ~fixed
+
+    # matches within each team
+    for team in sorted(set().union(*fpl['teams'])):
+        fpl_block = fpl[free_fpl & fpl['teams'].map(lambda teams: team in teams)]
+        other_block = other[free_other & other['teams'].map(lambda teams: team in teams)]
+        if len(fpl_block) == 0 or len(other_block) == 0:
+            continue
+        for i, j, score in assign(score_pairs(fpl_block, other_block), MATCH_THRESHOLD):
+            matches += [(other_block['id'].iloc[j], fpl_block['id'].iloc[i], score)]
+            free_fpl[fpl_block.index[i]] = False
+            free_other[other_block.index[j]] = False
+
+    # leftovers across all teams
+    fpl_rest, other_rest = fpl[free_fpl], other[free_other]
+    if len(fpl_rest) > 0 and len(other_rest) > 0:
+        for i, j, score in assign(score_pairs(fpl_rest, other_rest), UNBLOCKED_THRESHOLD):
+            matches += [(other_rest['id'].iloc[j], fpl_rest['id'].iloc[i], score)]
+
+    return pd.DataFrame(matches, columns=['id', 'fpl_id', 'score'])
+
+def load_fpl_players(data_dir):
+    """ FPL players of a season with full names, web names, team names and positions
+    """
+    players = read_csv(os.path.join(data_dir, 'players_raw.csv'), columns=['id', 'first_name', 'second_name', 'web_name', 'team', 'element_type'])
+    teams = read_csv(os.path.join(data_dir, 'teams.csv'), columns=['id', 'name'])
+    players['name'] = players['first_name'] + ' ' + players['second_name']
+    players['team'] = players['team'].map(dict(zip(teams['id'], teams['name'])))
+    players['position'] = players['element_type'].map(FPL_POSITIONS)
+    return players.loc[:, ['id', 'name', 'web_name', 'team', 'position']]
+
+def load_overrides(data_dir, source):
+    path = os.path.join(data_dir, 'id_overrides.csv')
+    if not os.path.exists(path):
+        return {}
+    overrides = read_csv(path)
+    overrides = overrides[overrides['source'] == source]
+    return dict(zip(overrides['source_id'].astype(str), overrides['fpl_id']))
+
+def load_sources(data_dir):
+    """ Player lists of the other sources found for a season, as {source: DataFrame of 'id', 'name', 'team', 'position'}
+    """
+    sources = {}
+    understat_path = os.path.join(data_dir, 'understat', 'understat_player.csv')
+    if os.path.exists(understat_path):
+        understat = read_csv(understat_path, columns=['id', 'player_name', 'team_title', 'position'])
+        sources['understat'] = understat.rename(columns={'player_name': 'name', 'team_title': 'team'})
+    fbref_path = os.path.join(data_dir, 'fbref_overview.csv')
+    if os.path.exists(fbref_path):
+        fbref = read_csv(fbref_path)
+        # older overview files were written before player ids were kept
+        if 'player_id' in fbref.columns:
+            fbref = fbref.loc[:, ['player_id', 'player', 'squad', 'position']].drop_duplicates('player_id')
+            sources['fbref'] = fbref.rename(columns={'player_id': 'id', 'player': 'name', 'squad': 'team'})
+    return sources
+
+def resolve_players(data_dir):
+    """ Resolve every available source for a season and write <data_dir>/player_ids.csv
+
+    Args:
+        data_dir (str): season folder, eg 'data/2024-25'
+
+    Returns:
+        DataFrame: one row per FPL player with '<source>_id', '<source>_name' and '<source>_score' columns, blank where unmatched
+    """
+    fpl = load_fpl_players(data_dir)
+    table = fpl.loc[:, ['id', 'name', 'team', 'position']].rename(columns={'id': 'fpl_id', 'name': 'fpl_name'})
+    for source, players in load_sources(data_dir).items():
+        matches = resolve(fpl, players, load_overrides(data_dir, source))
+        matches[f'{source}_name'] = matches['id'].map(dict(zip(players['id'], players['name'])))
+        matches = matches.rename(columns={'id': f'{source}_id', 'score': f'{source}_score'})
+        table = table.merge(matches, on='fpl_id', how='left')
+        if pd.api.types.is_numeric_dtype(table[f'{source}_id']):
+            table[f'{source}_id'] = table[f'{source}_id'].astype('Int64')
+    write_table(table, os.path.join(data_dir, 'player_ids.csv'), index=False)
+    return table
+
+def join_sources(data_dir, ids=None):
+    """ FPL season totals joined to the understat and fbref season stats through the resolved ids
+
+    Columns from the other sources are prefixed with the source name.
+    """
+    if ids is None:
+        ids = resolve_players(data_dir)
+    joined = ids.merge(read_csv(os.path.join(data_dir, 'players_raw.csv')).rename(columns={'id': 'fpl_id'}), on='fpl_id', how='left', suffixes=('', '_fpl'))
+    if 'understat_id' in ids.columns:
+        understat = read_csv(os.path.join(data_dir, 'understat', 'understat_player.csv')).add_prefix('understat_')
+        joined = joined.merge(understat, on='understat_id', how='left')
+    if 'fbref_id' in ids.columns:
+        fbref = read_csv(os.path.join(data_dir, 'fbref_overview.csv')).drop_duplicates('player_id').add_prefix('fbref_')
+        joined = joined.merge(fbref.rename(columns={'fbref_player_id': 'fbref_id'}), on='fbref_id', how='left')
+    return joined
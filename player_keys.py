@@ -0,0 +1,143 @@
+import os
+import re
+import numpy as np
+import pandas as pd
+from storage import read_csv, write_table
+
+# one integer player_key per player, shared by every season
+#   every (season, element) gets the key of its player, so two players with the same name in a season never share one.
+#   seasons are linked through FPL's player 'code', which stays the same from season to season while element ids
+#   and name spellings change. data/player_keys.csv records the key of every season's element ids, and is only
+#   ever added to so keys stay the same from one data refresh to the next.
+#   gameweek files name players 'First_Second' (2016-17, 2017-18), 'First_Second_<element>' (2018-19, 2019-20)
+#   and 'First Second' after that. Rows are keyed by their element id, and canonical_name is only used to look up
+#   rows whose element is missing from the table, by name within their season.
+
+KEY_COLUMNS = ['season', 'element', 'code', 'name', 'player_key']
+
+# {season: {element: key}} and {season: {canonical name: key, None if several players have the name}},
+# filled from player_keys.csv on first use
+_element_keys = None
+_season_names = None
+# (season, raw name) -> key, and canonical name -> key for names that are in no season of player_keys.csv
+_raw_keys = {}
+_extra_keys = {}
+_next_key = 0
+
+def canonical_name(name):
+    """ 'First_Second_123' / 'First_Second' / 'First Second' -> 'First Second'
+    """
+    return re.sub(r'\d+', '', str(name).replace('_', ' ')).strip()
+
+def keys_path(data_dir='data'):
+    return os.path.join(data_dir, 'player_keys.csv')
+
+def read_player_keys(data_dir='data'):
+    path = keys_path(data_dir)
+    if not os.path.exists(path):
+        return pd.DataFrame(columns=KEY_COLUMNS)
+    return read_csv(path)
+
+def build_player_keys(data_dir='data'):
+    """ Add every season's players_raw.csv to player_keys.csv, keeping the keys already given out
+
+    Run once per data refresh, after players_raw.csv is written.
+
+    Raises:
+        Exception: a season's players_raw.csv has no code column, or gives two players the same code
+
+    Returns:
+        DataFrame: 'season', 'element', 'code', 'name' (canonical) and 'player_key' columns
+    """
+    old = read_player_keys(data_dir)
+    if 'code' not in old.columns:
+        # tables from before codes were recorded keyed players by name alone, so they start again
+        old = pd.DataFrame(columns=KEY_COLUMNS)
+    code_keys = dict(zip(old['code'].astype('int64'), old['player_key'].astype('int64')))
+    next_key = int(old['player_key'].max()) + 1 if len(old) > 0 else 0
+
+    seasons = sorted(s for s in os.listdir(data_dir) if os.path.exists(os.path.join(data_dir, s, 'players_raw.csv')))
+    rows = []
+    for season in seasons:
+        players = read_csv(os.path.join(data_dir, season, 'players_raw.csv'), columns=['id', 'code', 'first_name', 'second_name'])
+        if 'code' not in players.columns:
+            raise Exception("players_raw.csv of " + season + " has no code column to link players across seasons")
+        duplicated = players['code'].duplicated(keep=False)
+        if duplicated.any():
+            raise Exception("players_raw.csv of " + season + " gives elements " + ", ".join(str(i) for i in players.loc[duplicated, 'id']) + " the same code")
+        for element, code, name in zip(players['id'], players['code'], players['first_name'] + ' ' + players['second_name']):
+            if code not in code_keys:
+                code_keys[code] = next_key
+                next_key += 1
+            rows += [(season, element, code, canonical_name(name), code_keys[code])]
+
+    # seasons that are no longer on disk keep their rows
+    table = pd.concat([old[~old['season'].isin(seasons)], pd.DataFrame(rows, columns=KEY_COLUMNS)], ignore_index=True)
+    table = table.astype({'element': 'int64', 'code': 'int64', 'player_key': 'int64'})
+    write_table(table, keys_path(data_dir), index=False)
+    reset_player_keys()
+    return table
+
+def reset_player_keys():
+    """ Forget the loaded table, so the next lookup reads player_keys.csv again
+    """
+    global _element_keys, _season_names, _raw_keys, _extra_keys
+    _element_keys = None
+    _season_names = None
+    _raw_keys = {}
+    _extra_keys = {}
+
+def load_player_keys(data_dir='data'):
+    global _element_keys, _season_names, _next_key
+    if _element_keys is None:
+        table = read_player_keys(data_dir)
+        _element_keys = {}
+        _season_names = {}
+        for season, df in table.groupby('season'):
+            keys = df['player_key'].astype(int)
+            _element_keys[season] = dict(zip(df['element'].astype(int), keys))
+            ambiguous = df['name'].duplicated(keep=False)
+            _season_names[season] = {name: None if several else key for name, key, several in zip(df['name'], keys, ambiguous)}
+        _next_key = int(table['player_key'].max()) + 1 if len(table) > 0 else 0
+
+def name_key(name, season):
+    """ Key of a raw name in a season, giving names that are in no season of player_keys.csv a new key for the rest of this process
+
+    Raises:
+        Exception: several players of the season have the name, so only their element ids tell them apart
+    """
+    global _next_key
+    if (season, name) not in _raw_keys:
+        canonical = canonical_name(name)
+        season_names = _season_names.get(season, {})
+        if canonical in season_names:
+            if season_names[canonical] is None:
+                raise Exception(canonical + " is more than one player in " + season + ", look them up by element id")
+            key = season_names[canonical]
+        else:
+            if canonical not in _extra_keys:
+                _extra_keys[canonical] = _next_key
+                _next_key += 1
+            key = _extra_keys[canonical]
+        _raw_keys[(season, name)] = key
+    return _raw_keys[(season, name)]
+
+def get_keys(names, season, data_dir='data'):
+    """ player_key of every raw name in a Series of one season's names, as a nullable integer Series with the same index
+
+    Each distinct name is only cleaned once per process. Missing names get a missing key.
+    """
+    load_player_keys(data_dir)
+    codes, uniques = pd.factorize(names)
+    keys = np.array([name_key(name, season) for name in uniques] + [-1], dtype=np.int64)[codes]
+    return pd.Series(pd.array(keys, dtype='Int64'), index=names.index).mask(codes == -1)
+
+def get_element_keys(season, elements, names=None, data_dir='data'):
+    """ player_key of every element id of a season, falling back to the names for ids not in player_keys.csv
+    """
+    load_player_keys(data_dir)
+    keys = elements.map(_element_keys.get(season, {})).astype('Int64')
+    missing = keys.isna()
+    if names is not None and missing.any():
+        keys[missing] = get_keys(names[missing], season, data_dir)
+    return keys
@@ -0,0 +1,140 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+# seconds a cached response is served without contacting the server, matched on url path
+DEFAULT_TTLS = {
+    'bootstrap-static/': 15 * 60,
+    'fixtures/': 60 * 60,
+    'element-summary/': 60 * 60,
+}
+
+class ResponseCache:
+    """ On-disk cache of GET responses with ETag/Last-Modified revalidation
+
+    Each url is stored as a body file and a small json metadata file holding its
+    validators and fetch time. Within its ttl a response is served straight from disk,
+    after that it is revalidated with a conditional request. Once the cache grows past
+    max_bytes the least recently used entries are evicted.
+
+    Args:
+        directory (str): folder the cache is kept in
+        ttls (dict): {url substring: ttl in seconds}, first match wins
+        default_ttl (int): ttl in seconds for urls matching no entry in ttls
+        max_bytes (int): size the cache is trimmed back to after each write
+        offline (bool): replay mode, serve only from the cache and never hit the network
+    """
+    def __init__(self, directory, ttls=DEFAULT_TTLS, default_ttl=0, max_bytes=512 * 1024 * 1024, offline=False):
+        self.directory = directory
+        self.ttls = ttls
+        self.default_ttl = default_ttl
+        self.max_bytes = max_bytes
+        self.offline = offline
+        self.lock = threading.Lock()
+        self.total_bytes = None
+        os.makedirs(directory, exist_ok=True)
+
+    def paths(self, url):
+        key = hashlib.sha1(url.encode('utf-8')).hexdigest()
+        base = os.path.join(self.directory, key)
+        return base + '.body', base + '.meta'
+
+    def ttl(self, url):
+        for pattern, ttl in self.ttls.items():
+            if pattern in url:
+                return ttl
+        return self.default_ttl
+
+    def lookup(self, url):
+        """ Return the cached entry for url as a dict, or None if there isn't one
+
+        The entry holds 'body', 'etag', 'last_modified', 'fetched_at' and 'fresh'
+        """
+        body_path, meta_path = self.paths(url)
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            with open(body_path, 'rb') as f:
+                body = f.read()
+        except (FileNotFoundError, ValueError):
+            return None
+        os.utime(meta_path)
+        meta['body'] = body
+        meta['fresh'] = time.time() - meta['fetched_at'] < self.ttl(url)
+        return meta
+
+    def conditional_headers(self, entry):
+        """ Build If-None-Match/If-Modified-Since headers from a cached entry
+        """
+        headers = {}
+        if entry is not None:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def store(self, url, body, etag=None, last_modified=None):
+        """ Write a response body and its validators, then trim the cache
+        """
+        body_path, meta_path = self.paths(url)
+        meta = json.dumps({'url': url, 'etag': etag, 'last_modified': last_modified, 'fetched_at': time.time()}).encode('utf-8')
+        self.write_atomic(body_path, body)
+        self.write_atomic(meta_path, meta)
+        with self.lock:
+            if self.total_bytes is not None:
+                # overwrites are counted twice, which only makes the next trim happen sooner
+                self.total_bytes += len(body) + len(meta)
+        self.evict()
+
+    def touch(self, url):
+        """ Mark a cached entry as just revalidated
+        """
+        entry = self.lookup(url)
+        if entry is not None:
+            _, meta_path = self.paths(url)
+            meta = {k: entry[k] for k in ['url', 'etag', 'last_modified']}
+            meta['fetched_at'] = time.time()
+            self.write_atomic(meta_path, json.dumps(meta).encode('utf-8'))
+
+    def write_atomic(self, path, data):
+        tmp_path = path + '.' + str(threading.get_ident()) + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def evict(self):
+        """ Remove least recently used entries until the cache fits in max_bytes
+
+        The directory is only rescanned once the running size estimate passes max_bytes
+        """
+        with self.lock:
+            if self.total_bytes is not None and self.total_bytes <= self.max_bytes:
+                return
+            entries = []
+            total = 0
+            for fname in os.listdir(self.directory):
+                if not fname.endswith('.meta'):
+                    continue
+                meta_path = os.path.join(self.directory, fname)
+                body_path = meta_path[:-len('.meta')] + '.body'
+                try:
+                    size = os.path.getsize(body_path) + os.path.getsize(meta_path)
+                    used = os.path.getmtime(meta_path)
+                except FileNotFoundError:
+                    continue
+                entries += [(used, size, body_path, meta_path)]
+                total += size
+            entries.sort()
+            for used, size, body_path, meta_path in entries:
+                if total <= self.max_bytes:
+                    break
+                for path in [meta_path, body_path]:
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+                total -= size
+            self.total_bytes = total
@@ -0,0 +1,194 @@
+import os
+import re
+import numpy as np
+import pandas as pd
+from storage import read_table, write_table
+
+# shot-level understat data, kept as one typed table per season at data/<season>/understat/shots.csv
+# (with a parquet copy when pyarrow is available), sorted by player and match so each player's
+# shots are contiguous. The per-player files written by understat.parse_epl_data cover a
+# player's whole career in every league, but only the scraped season's EPL players are fetched,
+# so a scrape only rebuilds its own season's table, from matches between that season's EPL teams.
+
+SHOT_TYPES = {
+    'id': 'int64',
+    'minute': 'int16',
+    'X': 'float32',
+    'Y': 'float32',
+    'xG': 'float32',
+    'player_id': 'int32',
+    'match_id': 'int32',
+    'h_goals': 'int8',
+    'a_goals': 'int8',
+    'game_state': 'int8',
+    'result': 'category',
+    'h_a': 'category',
+    'situation': 'category',
+    'shotType': 'category',
+    'lastAction': 'category',
+    'player': 'category',
+    'h_team': 'category',
+    'a_team': 'category',
+    'player_assisted': 'category',
+}
+
+# goal difference buckets for the shooting side, game_state is clipped to this range
+GAME_STATES = {-2: '<-1', -1: '-1', 0: '0', 1: '+1', 2: '>+1'}
+
+def get_season(understat_season):
+    """ '2024' -> '2024-25'
+    """
+    year = int(understat_season)
+    return f'{year}-{str(year + 1)[-2:]}'
+
+def set_shot_types(df):
+    for col, dtype in SHOT_TYPES.items():
+        if col not in df.columns:
+            continue
+        if dtype == 'category':
+            df[col] = df[col].astype('category')
+        else:
+            df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0).astype(dtype)
+    if 'date' in df.columns:
+        df['date'] = pd.to_datetime(df['date'])
+    return df
+
+def read_player_files(directory):
+    """ Every <player>_<id>.csv in a directory as one table, with player_id taken from the file name where missing
+    """
+    frames = []
+    for fname in sorted(os.listdir(directory)):
+        match = re.match(r'^.*_(\d+)\.csv$', fname)
+        if not match:
+            continue
+        path = os.path.join(directory, fname)
+        if os.path.getsize(path) <= 1:
+            continue
+        df = pd.read_csv(path, dtype=str, encoding='utf-8')
+        if 'player_id' not in df.columns:
+            df['player_id'] = match.group(1)
+        frames += [df]
+    if len(frames) == 0:
+        return pd.DataFrame()
+    return pd.concat(frames, ignore_index=True)
+
+def add_game_state(shots):
+    """ Goal difference for the shooting side just before each shot, clipped to GAME_STATES
+
+    Goals are counted from every shot in the match, own goals counting for the other side.
+    """
+    shots = shots.sort_values(['match_id', 'minute', 'id'], kind='stable')
+    result = shots['result'].astype(str)
+    home = (shots['h_a'].astype(str) == 'h').to_numpy()
+    home_goal = np.where(result == 'OwnGoal', ~home, home) & result.isin(['Goal', 'OwnGoal']).to_numpy()
+    away_goal = np.where(result == 'OwnGoal', home, ~home) & result.isin(['Goal', 'OwnGoal']).to_numpy()
+    # goals before the shot, so the shot's own goal is not counted
+    home_before = pd.Series(home_goal.astype(int), index=shots.index).groupby(shots['match_id']).cumsum() - home_goal
+    away_before = pd.Series(away_goal.astype(int), index=shots.index).groupby(shots['match_id']).cumsum() - away_goal
+    difference = np.where(home, home_before - away_before, away_before - home_before)
+    shots['game_state'] = np.clip(difference, -2, 2)
+    return shots
+
+def get_league_teams(understat_dir):
+    """ Titles of the teams in a scrape's league, from the understat_<team>.csv tables parse_epl_data writes
+    """
+    teams = set()
+    for fname in os.listdir(understat_dir):
+        match = re.match(r'^understat_(.*)\.csv$', fname)
+        if match and match.group(1) != 'player':
+            teams.add(match.group(1).replace('_', ' '))
+    return teams
+
+def build_shot_store(understat_dir):
+    """ Build the typed shots and groups tables of the scraped season from its per-player files
+
+    Only shots in matches between two of the season's EPL teams are kept, so every shot of a kept match
+    is in the scrape and game states are counted from complete matches. Other seasons in the player files
+    are left alone, their tables are only written by scraping them.
+
+    Args:
+        understat_dir (str): understat folder written by parse_epl_data, eg 'data/2024-25/understat'
+    """
+    season_dir = os.path.normpath(understat_dir)
+    season = os.path.basename(os.path.dirname(season_dir))
+    teams = get_league_teams(understat_dir)
+
+    shots = read_player_files(os.path.join(understat_dir, 'shots'))
+    if not shots.empty:
+        shots = shots[(shots['season'].map(get_season, na_action='ignore') == season) & shots['h_team'].isin(teams) & shots['a_team'].isin(teams)]
+        shots = set_shot_types(shots.drop_duplicates('id'))
+        shots = add_game_state(shots)
+        shots = shots.sort_values(['player_id', 'match_id', 'minute', 'id'], kind='stable')
+        write_table(shots.reset_index(drop=True), os.path.join(season_dir, 'shots.csv'), index=False)
+
+    groups = read_player_files(os.path.join(understat_dir, 'groups'))
+    if not groups.empty:
+        groups = groups[groups['season'].map(get_season, na_action='ignore') == season]
+        groups['player_id'] = groups['player_id'].astype('int32')
+        groups = groups.sort_values(['player_id', 'group'], kind='stable')
+        write_table(groups.reset_index(drop=True), os.path.join(season_dir, 'groups.csv'), index=False)
+
+class ShotStore:
+    """ Query API over a season's shots table, which is loaded once and kept in memory
+
+    Args:
+        season (str): season in 'YYYY-YY'
+        data_dir (str): folder holding the season folders
+    """
+    def __init__(self, season, data_dir='data'):
+        self.path = os.path.join(data_dir, season, 'understat')
+        self.table = None
+        self.groups_table = None
+
+    def shots(self, player_ids=None, match_ids=None):
+        """ Shots, optionally for some players and/or matches
+        """
+        if self.table is None:
+            self.table = set_shot_types(read_table(os.path.join(self.path, 'shots.csv')))
+        df = self.table
+        if player_ids is not None:
+            df = df[df['player_id'].isin(player_ids)]
+        if match_ids is not None:
+            df = df[df['match_id'].isin(match_ids)]
+        return df
+
+    def groups(self, group=None, player_ids=None):
+        """ A player's season aggregates from understat's groupsData, eg group='situation' or 'shotZones'
+        """
+        if self.groups_table is None:
+            self.groups_table = read_table(os.path.join(self.path, 'groups.csv'))
+        df = self.groups_table
+        if group is not None:
+            df = df[df['group'] == group]
+        if player_ids is not None:
+            df = df[df['player_id'].isin(player_ids)]
+        return df
+
+    def xg_by_game_state(self, player_ids=None, non_penalty=False):
+        """ xG and shots per player for each game state (goal difference of the player's side when shooting)
+
+        Returns:
+            DataFrame: indexed by player_id and player, with ('xG', state) and ('shots', state) columns
+        """
+        df = self.shots(player_ids)
+        if non_penalty:
+            df = df[df['situation'] != 'Penalty']
+        state = df['game_state'].map(GAME_STATES)
+        table = df.assign(state=pd.Categorical(state, list(GAME_STATES.values()))).pivot_table(
+            index=['player_id', 'player'], columns='state', values='xG', aggfunc=['sum', 'count'], observed=True)
+        return table.rename(columns={'sum': 'xG', 'count': 'shots'}, level=0).fillna(0)
+
+    def location_histogram(self, player_ids=None, bins=(12, 8), weights=None):
+        """ 2d histogram of shot locations on understat's 0-1 pitch coordinates (X towards goal, Y across)
+
+        Args:
+            player_ids (list, optional): players to include, defaults to all
+            bins (tuple): number of X and Y bins
+            weights (str, optional): column to weight shots by, eg 'xG', defaults to shot counts
+
+        Returns:
+            tuple: histogram (X bins x Y bins), X edges, Y edges
+        """
+        df = self.shots(player_ids)
+        w = None if weights is None else df[weights].to_numpy(dtype=float)
+        return np.histogram2d(df['X'].to_numpy(dtype=float), df['Y'].to_numpy(dtype=float), bins=bins, range=[[0, 1], [0, 1]], weights=w)
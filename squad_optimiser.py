@@ -0,0 +1,239 @@
+import numpy as np
+import pandas as pd
+
+# scipy is optional: without it squads are picked by the greedy fallback
+try:
+    from scipy import sparse
+    from scipy.optimize import milp, LinearConstraint, Bounds
+    HAS_MILP = True
+except ImportError:
+    HAS_MILP = False
+
+# FPL squad rules, values are in the tenths of a million used by the value column
+BUDGET = 1000
+SQUAD_QUOTAS = {'GK': 2, 'DEF': 5, 'MID': 5, 'FWD': 3}
+MAX_PER_TEAM = 3
+STARTERS = 11
+# (min, max) starters per position in any valid formation
+FORMATION_LIMITS = {'GK': (1, 1), 'DEF': (3, 5), 'MID': (2, 5), 'FWD': (1, 3)}
+# seconds the ILP solver may take before select_squad falls back to the greedy squad
+TIME_LIMIT = 0.5
+
+def prepare_players(players, points):
+    """
+    Summary:
+        candidate pool: players with points and a value, in a fresh 0..n-1 index
+    """
+    players = players.dropna(subset = [points, 'value'])
+    players = players[players['position'].isin(SQUAD_QUOTAS.keys())]
+    return players.reset_index(drop = True)
+
+def best_lineup(squad, points = 'y_hat'):
+    """
+    Summary:
+        the highest scoring valid starting eleven from a squad: each position's minimum is filled first,
+        then the best remaining outfield players up to the position maximums
+
+    Args:
+        squad (df): players with 'position' and points columns
+        points (str): column to maximise
+
+    Returns:
+        array: boolean mask over squad rows, True for starters
+    """
+    order = np.argsort(-squad[points].to_numpy(), kind = 'stable')
+    positions = squad['position'].to_numpy()[order]
+    starter = np.zeros(len(squad), dtype = bool)
+    counts = {position: 0 for position in FORMATION_LIMITS}
+    for i, position in zip(order, positions):
+        if counts[position] < FORMATION_LIMITS[position][0]:
+            starter[i] = True
+            counts[position] += 1
+    for i, position in zip(order, positions):
+        if starter.sum() >= STARTERS:
+            break
+        if not starter[i] and counts[position] < FORMATION_LIMITS[position][1]:
+            starter[i] = True
+            counts[position] += 1
+    return starter
+
+def undominated(players, points, quotas, max_per_team):
+    """
+    Summary:
+        mask of the players an optimal squad may need. A player is dropped when players of the same position that cost
+        no more and score no less come from enough clubs that one of them can always take their place: one club per
+        other squad place of that position, plus one for every club the rest of the squad could have filled
+
+    Returns:
+        array: boolean mask over players rows
+    """
+    y = players[points].to_numpy(dtype = float)
+    value = players['value'].to_numpy(dtype = float)
+    positions = players['position'].to_numpy()
+    _, teams = np.unique(players['team'].to_numpy(), return_inverse = True)
+    full_clubs = (sum(quotas.values()) - 1) // max_per_team
+    # strict order so that equal players do not drop each other
+    rank = np.empty(len(players), dtype = int)
+    rank[np.lexsort((-y, value))] = np.arange(len(players))
+
+    keep = np.ones(len(players), dtype = bool)
+    for position, quota in quotas.items():
+        members = np.where(positions == position)[0]
+        v, p, r = value[members], y[members], rank[members]
+        dominated_by = (v[None, :] <= v[:, None]) & (p[None, :] >= p[:, None]) & (r[None, :] < r[:, None])
+        clubs = (dominated_by.astype(int) @ np.eye(teams.max() + 1, dtype = int)[teams[members]] > 0).sum(axis = 1)
+        keep[members] = clubs < quota + full_clubs
+    return keep
+
+def squad_points(players, points, selected, starter, bench_weight):
+    """
+    Summary:
+        the objective both solvers maximise: starter points plus bench_weight x bench points
+    """
+    y = players[points].to_numpy(dtype = float)
+    return y[starter].sum() + bench_weight * y[selected & ~starter].sum()
+
+def solve_ilp(players, points, budget, quotas, max_per_team, bench_weight, time_limit = TIME_LIMIT):
+    """
+    Summary:
+        exact squad and starting eleven with scipy's HiGHS mixed integer solver
+        variables are [starting (n), on the bench (n)], the objective is starter points plus bench_weight x bench points
+        only undominated players are given to the solver, and constraints are built as sparse matrices
+
+    Returns:
+        tuple: squad and starter masks and whether they were proven optimal within time_limit seconds,
+        or None if the solver found no squad at all
+    """
+    keep = undominated(players, points, quotas, max_per_team)
+    pool = players[keep]
+    n = len(pool)
+    y = pool[points].to_numpy(dtype = float)
+    value = pool['value'].to_numpy(dtype = float)
+    positions = pool['position'].to_numpy()
+    teams = pool['team'].to_numpy()
+    index = np.arange(n)
+    both = np.concatenate([index, index + n])
+
+    # coefficients as (row, column, value) triplets, so each rule only stores the players it counts
+    rows, cols, coefs, lower, upper = [], [], [], [], []
+    def add(columns, values, lo, hi):
+        rows.append(np.full(len(columns), len(lower)))
+        cols.append(columns)
+        coefs.append(values)
+        lower.append(lo)
+        upper.append(hi)
+
+    add(both, np.concatenate([value, value]), -np.inf, budget)
+    for position, quota in quotas.items():
+        members = index[positions == position]
+        add(np.concatenate([members, members + n]), np.ones(2 * len(members)), quota, quota)
+        add(members, np.ones(len(members)), *FORMATION_LIMITS[position])
+    for team in np.unique(teams):
+        members = index[teams == team]
+        add(np.concatenate([members, members + n]), np.ones(2 * len(members)), 0, max_per_team)
+    add(index, np.ones(n), STARTERS, STARTERS)
+    # a player either starts, sits on the bench or is not picked
+    for i in index:
+        add(np.array([i, i + n]), np.ones(2), 0, 1)
+    rules = sparse.csr_array((np.concatenate(coefs), (np.concatenate(rows), np.concatenate(cols))), shape = (len(lower), 2 * n))
+
+    objective = -np.concatenate([y, bench_weight * y])
+    result = milp(objective, constraints = LinearConstraint(rules, lower, upper), integrality = np.ones(2 * n),
+                  bounds = Bounds(0, 1), options = {'time_limit': time_limit})
+    if result.x is None:
+        return None
+    x = np.round(result.x).astype(bool)
+    selected = np.zeros(len(players), dtype = bool)
+    starter = np.zeros(len(players), dtype = bool)
+    selected[keep], starter[keep] = x[:n] | x[n:], x[:n]
+    return selected, starter, result.status == 0
+
+def solve_greedy(players, points, budget, quotas, max_per_team):
+    """
+    Summary:
+        fallback without an ILP solver: starts from the cheapest valid squad and applies the best
+        single-player swap (same position, within budget and club limit) until no swap adds points
+    """
+    y = players[points].to_numpy(dtype = float)
+    value = players['value'].to_numpy(dtype = float)
+    positions = players['position'].to_numpy()
+    teams = players['team'].to_numpy()
+
+    selected = np.zeros(len(players), dtype = bool)
+    team_counts = {}
+    for position, quota in quotas.items():
+        candidates = np.where(positions == position)[0]
+        for i in candidates[np.lexsort((-y[candidates], value[candidates]))]:
+            if (selected & (positions == position)).sum() == quota:
+                break
+            if team_counts.get(teams[i], 0) < max_per_team:
+                selected[i] = True
+                team_counts[teams[i]] = team_counts.get(teams[i], 0) + 1
+    if (value[selected].sum() > budget) or selected.sum() != sum(quotas.values()):
+        raise ValueError('No squad satisfies the budget, quotas and club limit')
+
+    while True:
+        spare = budget - value[selected].sum()
+        best_gain, best_swap = 0, None
+        for out in np.where(selected)[0]:
+            fits = (~selected) & (positions == positions[out]) & (value <= value[out] + spare) & (y > y[out] + best_gain)
+            full = [team for team, count in team_counts.items() if count >= max_per_team and team != teams[out]]
+            fits &= ~np.isin(teams, full)
+            if fits.any():
+                new = np.where(fits)[0][np.argmax(y[fits])]
+                best_gain, best_swap = y[new] - y[out], (out, new)
+        if best_swap is None:
+            break
+        out, new = best_swap
+        selected[out], selected[new] = False, True
+        team_counts[teams[out]] -= 1
+        team_counts[teams[new]] = team_counts.get(teams[new], 0) + 1
+
+    starter = np.zeros(len(players), dtype = bool)
+    starter[np.where(selected)[0]] = best_lineup(players[selected], points)
+    return selected, starter
+
+def select_squad(players, points = 'y_hat', budget = BUDGET, quotas = SQUAD_QUOTAS, max_per_team = MAX_PER_TEAM, bench_weight = 0.1, method = 'ilp', time_limit = TIME_LIMIT):
+    """
+    Summary:
+        picks the 15-man squad and starting eleven that maximise expected points under the FPL rules
+
+    Args:
+        players (df): one row per player with 'name', 'team', 'position', 'value' and the points column, eg valuation.score_players for one gw
+        points (str): column to maximise
+        budget (int): squad budget in the units of 'value'
+        quotas (dic): {position: squad places}
+        max_per_team (int): most players allowed from one club
+        bench_weight (float): weight given to the points of the four substitutes
+        method (str): 'ilp' for the exact solver, 'greedy' for the fallback, the fallback is also used when scipy is missing
+        time_limit (float): seconds the exact solver may take. If it has not proven its squad optimal by then,
+            the greedy squad is used instead whenever it scores more
+
+    Returns:
+        df: the squad with a boolean 'starter' column, ordered by position
+    """
+    players = prepare_players(players, points)
+    if method not in ['ilp', 'greedy']:
+        raise NameError("method must be one of ['ilp', 'greedy']")
+    solution, optimal = None, False
+    if method == 'ilp' and HAS_MILP:
+        result = solve_ilp(players, points, budget, quotas, max_per_team, bench_weight, time_limit)
+        if result is not None:
+            solution, optimal = result[:2], result[2]
+    if solution is None:
+        solution = solve_greedy(players, points, budget, quotas, max_per_team)
+    elif not optimal:
+        try:
+            greedy = solve_greedy(players, points, budget, quotas, max_per_team)
+        except ValueError:
+            greedy = None
+        if greedy is not None and squad_points(players, points, *greedy, bench_weight) > squad_points(players, points, *solution, bench_weight):
+            solution = greedy
+    selected, starter = solution
+
+    squad = players[selected].copy()
+    squad['starter'] = starter[selected]
+    squad['position'] = pd.Categorical(squad['position'], list(quotas.keys()))
+    squad = squad.sort_values(['position', 'starter', points], ascending = [True, False, False])
+    squad['position'] = squad['position'].astype(str)
+    return squad
@@ -0,0 +1,152 @@
+import os
+import pandas as pd
+
+# pyarrow is optional: without it tables are only stored and read as csv
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    HAS_PARQUET = True
+except ImportError:
+    HAS_PARQUET = False
+
+# columns pinned to float so every gameweek file shares one parquet schema
+FLOAT_COLUMNS = ['xP', 'influence', 'creativity', 'threat', 'ict_index', 'expected_goals', 'expected_assists',
+                 'expected_goal_involvements', 'expected_goals_conceded']
+
+def parquet_path(csv_path):
+    """ Path of the parquet file stored alongside a csv
+    """
+    return os.path.splitext(csv_path)[0] + '.parquet'
+
+def has_fresh_parquet(csv_path):
+    """ True if a parquet copy exists and is at least as new as the csv
+    """
+    if not HAS_PARQUET:
+        return False
+    path = parquet_path(csv_path)
+    if not os.path.exists(path):
+        return False
+    if not os.path.exists(csv_path):
+        return True
+    return os.path.getmtime(path) >= os.path.getmtime(csv_path)
+
+def read_csv(csv_path, columns=None, index_col=None, encoding=None):
+    """ Read a csv, trying utf-8 before latin-1 unless an encoding is given
+
+    Seasons up to 2018-19 were written as latin-1 and later ones as utf-8.
+    """
+    usecols = None
+    if columns != None:
+        usecols = lambda c: c in columns or (index_col != None and c == 'Unnamed: 0')
+    if encoding != None:
+        return pd.read_csv(csv_path, usecols=usecols, index_col=index_col, encoding=encoding)
+    try:
+        return pd.read_csv(csv_path, usecols=usecols, index_col=index_col, encoding='utf-8')
+    except UnicodeDecodeError:
+        return pd.read_csv(csv_path, usecols=usecols, index_col=index_col, encoding='latin-1')
+
+def set_types(df):
+    for col in FLOAT_COLUMNS:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors='coerce').astype('float64')
+    return df
+
+def write_parquet(csv_path, df=None, index_col=None):
+    """ Write a typed parquet copy of a table next to its csv
+
+    Args:
+        csv_path (str): path of the csv the parquet file belongs to
+        df (DataFrame, optional): table to store, read from csv_path if not given
+        index_col (int, optional): index column used when reading csv_path
+    """
+    if not HAS_PARQUET:
+        return
+    if df is None:
+        df = read_csv(csv_path, index_col=index_col)
+    set_types(df.copy()).to_parquet(parquet_path(csv_path))
+
+def write_table(df, csv_path, index=True, encoding='utf-8'):
+    """ Write a DataFrame to csv and to a parquet copy alongside it
+    """
+    df.to_csv(csv_path, index=index, encoding=encoding)
+    if not index:
+        df = df.reset_index(drop=True)
+    write_parquet(csv_path, df)
+
+class TableWriter:
+    """ Write a table to csv and a parquet copy one chunk at a time, so only the current chunk is held in memory
+
+    Every chunk must have the same columns and types, the first non-empty chunk sets the parquet schema.
+    The index is not written.
+
+    Args:
+        csv_path (str): path of the csv, the parquet copy is written alongside it
+        encoding (str): csv encoding
+    """
+    def __init__(self, csv_path, encoding='utf-8'):
+        self.csv_path = csv_path
+        self.encoding = encoding
+        self.header = True
+        self.writer = None
+
+    def write(self, df):
+        df.to_csv(self.csv_path, mode='w' if self.header else 'a', header=self.header, index=False, encoding=self.encoding)
+        self.header = False
+        # empty chunks carry no types, so they only add to the csv
+        if not HAS_PARQUET or len(df) == 0:
+            return
+        table = pa.Table.from_pandas(set_types(df.reset_index(drop=True)), preserve_index=False)
+        if self.writer is None:
+            self.writer = pq.ParquetWriter(parquet_path(self.csv_path), table.schema)
+        self.writer.write_table(table.cast(self.writer.schema))
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+def write_table_chunks(chunks, csv_path, encoding='utf-8'):
+    """ Write DataFrames from an iterable to one csv and parquet copy with a TableWriter
+    """
+    writer = TableWriter(csv_path, encoding)
+    try:
+        for df in chunks:
+            writer.write(df)
+    finally:
+        writer.close()
+
+def append_table(df, csv_path):
+    """ Append rows (with their index) to a csv table and bring its parquet copy up to date
+
+    The csv is only appended to, the parquet copy is rewritten from its previous contents plus the new rows.
+    """
+    fresh = has_fresh_parquet(csv_path)
+    header = not os.path.exists(csv_path) or os.path.getsize(csv_path) == 0
+    df.to_csv(csv_path, mode='a', header=header, encoding='utf-8')
+    if not HAS_PARQUET:
+        return
+    if fresh:
+        df = pd.concat([pd.read_parquet(parquet_path(csv_path)), df], axis=0)
+    else:
+        df = read_csv(csv_path, index_col=0)
+    write_parquet(csv_path, df)
+
+def read_table(csv_path, columns=None, index_col=None, encoding=None):
+    """ Read a table, preferring its parquet copy when that is up to date
+
+    Only the requested columns are read from either format. Columns that are not in the
+    table are skipped rather than raising, as the gameweek files gain columns over seasons.
+
+    Args:
+        csv_path (str): path of the csv, the parquet copy is found from it
+        columns (list, optional): columns to read, defaults to all
+        index_col (int, optional): index column of the csv, parquet copies store their index
+        encoding (str, optional): csv encoding, guessed if not given
+    """
+    if has_fresh_parquet(csv_path):
+        path = parquet_path(csv_path)
+        if columns != None:
+            names = pq.read_schema(path).names
+            columns = [c for c in columns if c in names]
+        return pd.read_parquet(path, columns=columns)
+    return read_csv(csv_path, columns, index_col, encoding)
@@ -1,8 +1,34 @@
 from getters import *
 from parsers import *
+from fetcher import RateLimiter, fetch_concurrently
+from storage import TableWriter
 import sys
 import os
 
+FPL_HOST = 'fantasy.premierleague.com'
+
+# tables written by store_entries, each with its columns and the types they are cast to
+ENTRY_TABLES = {
+    'entries': {'entry': 'Int64', 'name': 'string', 'player_first_name': 'string', 'player_last_name': 'string',
+                'player_region_name': 'string', 'started_event': 'Int64', 'favourite_team': 'Int64',
+                'summary_overall_points': 'Int64', 'summary_overall_rank': 'Int64', 'last_deadline_value': 'Int64',
+                'last_deadline_bank': 'Int64', 'last_deadline_total_transfers': 'Int64'},
+    'history': {'entry': 'Int64', 'event': 'Int64', 'points': 'Int64', 'total_points': 'Int64', 'rank': 'Int64',
+                'overall_rank': 'Int64', 'bank': 'Int64', 'value': 'Int64', 'event_transfers': 'Int64',
+                'event_transfers_cost': 'Int64', 'points_on_bench': 'Int64'},
+    'past': {'entry': 'Int64', 'season_name': 'string', 'total_points': 'Int64', 'rank': 'Int64'},
+    'chips': {'entry': 'Int64', 'name': 'string', 'time': 'string', 'event': 'Int64'},
+    'transfers': {'entry': 'Int64', 'event': 'Int64', 'time': 'string', 'element_in': 'Int64', 'element_in_cost': 'Int64',
+                  'element_out': 'Int64', 'element_out_cost': 'Int64'},
+    'leagues': {'entry': 'Int64', 'kind': 'string', 'id': 'Int64', 'name': 'string', 'league_type': 'string',
+                'entry_rank': 'Int64', 'entry_last_rank': 'Int64'},
+    'picks': {'entry': 'Int64', 'event': 'Int64', 'element': 'Int64', 'position': 'Int64', 'multiplier': 'Int64',
+              'is_captain': 'boolean', 'is_vice_captain': 'boolean', 'active_chip': 'string'},
+}
+
+# one request per entry to each of these, picks are fetched per gameweek afterwards
+ENTRY_GETTERS = {'history': get_entry_data, 'personal': get_entry_personal_data, 'transfers': get_entry_transfers_data}
+
 def store_data(team_id, output_folder, start_gw):
     summary = get_entry_data(team_id)
     personal_data = get_entry_personal_data(team_id)
@@ -15,7 +41,137 @@ def store_data(team_id, output_folder, start_gw):
     parse_transfer_history(transfers, output_folder)
     parse_gw_entry_history(gws, output_folder)
 
+def read_entry_ids(entries):
+    """ Entry ids from a file with one id at the start of each line, or from a comma separated string
+    """
+    if os.path.exists(entries):
+        with open(entries) as f:
+            ids = [line.split(',')[0].strip() for line in f]
+    else:
+        ids = entries.split(',')
+    return [int(i) for i in ids if i.strip().isdigit()]
+
+def entry_table(records, table, entry_id):
+    """ Records for one entry as a typed ENTRY_TABLES table
+    """
+    df = pd.DataFrame.from_records(records)
+    df['entry'] = entry_id
+    types = ENTRY_TABLES[table]
+    return df.reindex(columns=list(types)).astype(types)
+
+def entry_tables(entry_id, responses, events):
+    """ Every ENTRY_TABLES table for one entry, from its fetched responses
+    """
+    summary = responses[(entry_id, 'history', None)]
+    personal = responses[(entry_id, 'personal', None)]
+    leagues = [dict(league, kind=kind) for kind in ['classic', 'h2h'] for league in personal['leagues'][kind]]
+    picks = []
+    for event in events:
+        gw = responses[(entry_id, 'picks', event)]
+        picks += [dict(pick, event=event, active_chip=gw['active_chip']) for pick in gw['picks']]
+    return {
+        'entries': entry_table([personal], 'entries', entry_id),
+        'history': entry_table(summary['current'], 'history', entry_id),
+        'past': entry_table(summary['past'], 'past', entry_id),
+        'chips': entry_table(summary['chips'], 'chips', entry_id),
+        'transfers': entry_table(responses[(entry_id, 'transfers', None)], 'transfers', entry_id),
+        'leagues': entry_table(leagues, 'leagues', entry_id),
+        'picks': entry_table(picks, 'picks', entry_id),
+    }
+
+def fetch_entry(key):
+    entry_id, endpoint, gw = key
+    if endpoint == 'picks':
+        return get_entry_gw_picks(entry_id, gw)
+    return ENTRY_GETTERS[endpoint](entry_id)
+
+def fetch_entries(keys, max_workers, rate_limiter):
+    """ Fetch (entry id, endpoint, gw) keys concurrently
+
+    Returns:
+        tuple: {key: response}, set of entry ids that had a request fail
+    """
+    def fetch(key):
+        try:
+            return fetch_entry(key)
+        except Exception as e:
+            print("Failed to get " + key[1] + " data for entry " + str(key[0]) + ": " + str(e))
+            return None
+
+    responses = {}
+    failed = set()
+    for key, data in fetch_concurrently(fetch, keys, max_workers, rate_limiter, FPL_HOST):
+        if data is None:
+            failed.add(key[0])
+        else:
+            responses[key] = data
+    return responses, failed
+
+def store_entries(entry_ids, output_folder, start_gw=1, max_workers=8, requests_per_second=10, batch_size=100):
+    """ Fetch many entries concurrently and write them to one table per kind of data
+
+    Summaries, personal data, transfers and every gameweek's picks are fetched on up to max_workers threads,
+    limited to requests_per_second across all of them. Each table in ENTRY_TABLES is written to
+    <output_folder>/<table>.csv (with a parquet copy) with an 'entry' column, batch_size entries at a time.
+    An entry with a failed request is reported and left out.
+
+    Args:
+        entry_ids (list): entry ids to fetch
+        output_folder (str): folder for the tables
+        start_gw (int): first gameweek to fetch picks for
+        max_workers (int): maximum number of requests in flight at once
+        requests_per_second (float): request rate limit against the FPL api
+        batch_size (int): entries fetched before their rows are written
+
+    Returns:
+        list: ids of the entries that failed
+    """
+    os.makedirs(output_folder, exist_ok=True)
+    rate_limiter = RateLimiter(requests_per_second)
+    writers = {table: TableWriter(os.path.join(output_folder, table + '.csv')) for table in ENTRY_TABLES}
+    failed = []
+    try:
+        for i in range(0, len(entry_ids), batch_size):
+            batch = entry_ids[i:i + batch_size]
+            keys = [(entry_id, endpoint, None) for entry_id in batch for endpoint in ENTRY_GETTERS]
+            responses, batch_failed = fetch_entries(keys, max_workers, rate_limiter)
+            events = {}
+            for entry_id in batch:
+                if entry_id not in batch_failed:
+                    events[entry_id] = [gw['event'] for gw in responses[(entry_id, 'history', None)]['current'] if gw['event'] >= start_gw]
+            keys = [(entry_id, 'picks', event) for entry_id in events for event in events[entry_id]]
+            picks, picks_failed = fetch_entries(keys, max_workers, rate_limiter)
+            responses.update(picks)
+            batch_failed |= picks_failed
+            failed += [entry_id for entry_id in batch if entry_id in batch_failed]
+
+            frames = {table: [] for table in ENTRY_TABLES}
+            for entry_id in batch:
+                if entry_id in batch_failed:
+                    continue
+                for table, df in entry_tables(entry_id, responses, events[entry_id]).items():
+                    frames[table] += [df]
+            for table, dfs in frames.items():
+                df = pd.concat(dfs, ignore_index=True) if len(dfs) > 0 else entry_table([], table, None)
+                writers[table].write(df)
+            print("Stored " + str(min(i + batch_size, len(entry_ids))) + " of " + str(len(entry_ids)) + " entries")
+    finally:
+        for writer in writers.values():
+            writer.close()
+    return failed
+
 def main():
+    if len(sys.argv) >= 2 and sys.argv[1] == '--batch':
+        if len(sys.argv) < 4:
+            print("Usage: python teams_scraper.py --batch <ids_file_or_comma_separated_ids> <season_short_code> <start_gw>. Eg: python teams_scraper.py --batch rivals.txt 21_22 1")
+            sys.exit(1)
+        entry_ids = read_entry_ids(sys.argv[2])
+        start_gw = int(sys.argv[4]) if len(sys.argv) == 5 else 1
+        failed = store_entries(entry_ids, "teams_data" + sys.argv[3], start_gw)
+        if len(failed) > 0:
+            print("Failed entries: " + ",".join(str(entry_id) for entry_id in failed))
+        return
+
     if len(sys.argv) < 3:
         print("Usage: python teams_scraper.py <team_id> <season_short_code> <start_gw>. Eg: python teams_scraper.py 5000 21_22 1")
         sys.exit(1)
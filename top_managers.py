@@ -1,95 +1,246 @@
-import requests , json, csv
+import csv
+import json
+import math
+import os
 import pandas as pd
-
-# Overall FPL league ID, 314 for 2019/20 season.
-overallLeageID = 314
-
-# number of GW in 2019/20 season. Done as array to avoid calling api for blank GW 30-38.
-gameWeeks = [1,2,3,4,5,6,7,8,9,10,11,12,13,14,15,16,17,18,19,20,21,22,23,24,25,26,27,28,29,39,40,
-		41,42,43,44,45,46,47]
-
-# adds the top 10 team ID's to this array
-teamIDarray = []
-
-# number of top manager information required.
-topManagerNumber = 10
-
-url = "https://fantasy.premierleague.com/api/leagues-classic/"+str(overallLeageID)+"/standings/"
-
-response = requests.get(url)
-data = response.text
-parsed = json.loads(data)
-managerParsed = parsed['standings']['results']
-
-# open 3 files for writing
-manager_data = open('data/2019-20/managers/top_managers.csv', 'w', newline='', encoding="utf-8")
-gw_data = open('data/2019-20/managers/top_managers_gwInfo.csv', 'w', newline='', encoding="utf-8")
-gw_picks = open('data/2019-20/managers/top_managers_gwPicks.csv', 'w', newline='', encoding="utf-8")
-
-# create the 3 csv writer objects
-csvwriter1 = csv.writer(manager_data)
-csvwriter2 = csv.writer(gw_data)
-csvwriter3 = csv.writer(gw_picks)
-
-#get csv of top 10 manager information and write to top_managers.csv
-count = 0
-for manager in managerParsed:
-	if count == 0:
-		header = ['rank','entry','player_name','entry_name','total']
-		csvwriter1.writerow(header)
-		count += 1
-	
-	if count <= topManagerNumber:
-		csvwriter1.writerow([manager['rank'],manager['entry'],manager['player_name'],
-						manager['entry_name'],manager['total']])
-
-		count +=1
-		teamIDarray.append(manager['entry'])
-
-# for each teamID in the top 10, call the api and update both top_managers_gwInfo.csv and top_managers_gwPicks.csv
-count1 = 0
-count2 = 0
-for teamID in teamIDarray:
-	for x in gameWeeks:
-		url = "https://fantasy.premierleague.com/api/entry/"+str(teamID)+"/event/"+str(x)+"/picks/"
-		response = requests.get(url)
-		data = response.text
-		parsed = json.loads(data)
-
-		# write data to top_managers_gwInfo.csv
-		if count1 == 0:
-			header = ['team_id','gw','points','bench','gw_rank','transfers','hits','total_points',
-				'overall_ank','team_value','chip']
-
-			csvwriter2.writerow(header)
-			count1 += 1
-		try:
-			csvwriter2.writerow([teamID,x, parsed['entry_history']['points'], parsed['entry_history']['points_on_bench'],
-							parsed['entry_history']['rank'], parsed['entry_history']['event_transfers'],
-							parsed['entry_history']['event_transfers_cost'], parsed['entry_history']['total_points'],
-							parsed['entry_history']['overall_rank'], int(parsed['entry_history']['value'])/10, parsed['active_chip']])
-		except:
-			continue
-
-		# write data to top_managers_gwPicks.csv
-		for i in range(len(parsed['picks'])):
-			if count2 == 0:
-				header = ['team_id','gw','id','position','multiplier']
-				csvwriter3.writerow(header)
-				count2 += 1
-			csvwriter3.writerow([teamID, x, parsed['picks'][i]['element'], parsed['picks'][i]['position'], parsed['picks'][i]['multiplier']])
-
-manager_data.close()
-gw_data.close()
-gw_picks.close()
-
-# do some formatting on top_managers_gwPicks by adding the name of the player picked from player_idlist.csv
-df = pd.read_csv('data/2019-20/managers/top_managers_gwPicks.csv')
-df1 = pd.read_csv('data/2019-20/player_idlist.csv') 
-
-merged = df.merge(df1, on=['id'])
-merged.drop('first_name', axis=1, inplace=True)
-merged = merged[['team_id', 'gw', 'second_name', 'id', 'position', 'multiplier']]
-merged.rename({'id': 'player_id'}, axis=1, inplace=True)
-merged=merged.sort_values(by=['team_id', 'gw', 'position'])
-merged.to_csv('data/2019-20/managers/top_managers_gwPicks.csv',index=False)
+from getters import get_data, get_league_standings, get_entry_gw_picks
+from fetcher import RateLimiter, fetch_concurrently
+
+FPL_HOST = 'fantasy.premierleague.com'
+
+# entries per page of league standings
+PAGE_SIZE = 50
+
+MANAGER_HEADER = ['rank', 'entry', 'player_name', 'entry_name', 'total']
+GW_INFO_HEADER = ['team_id', 'gw', 'points', 'bench', 'gw_rank', 'transfers', 'hits', 'total_points', 'overall_ank', 'team_value', 'chip']
+PICKS_HEADER = ['team_id', 'gw', 'id', 'position', 'multiplier']
+
+def get_played_gws():
+    """ Gameweeks of the current season that have started, and those of them still being played
+    """
+    events = get_data()['events']
+    played = [event['id'] for event in events if event['finished'] or event['is_current']]
+    live = [event['id'] for event in events if event['is_current'] and not event['finished']]
+    return played, live
+
+def append_rows(path, header, rows):
+    new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+    with open(path, 'a', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        if new_file:
+            writer.writerow(header)
+        writer.writerows(rows)
+
+class LeagueCrawler:
+    """ Crawl the top entries of a classic league and their picks, resuming from a checkpoint if interrupted
+
+    Standings pages and picks are fetched on up to max_workers threads, limited to requests_per_second.
+    Rows are appended to top_managers.csv, top_managers_gwInfo.csv and top_managers_gwPicks.csv in output_folder
+    a batch of entries at a time, and crawl_checkpoint.json records which pages and (entry, gw) picks are complete.
+    Running the same crawl again only fetches what is missing: picks of new gameweeks, and of a gameweek still
+    being played, whose points and ranks keep changing. The first standings page is fetched on every run, and
+    if it has moved since the last one the standings are fetched again.
+
+    Args:
+        league_id (int): classic league id, eg 314 for the overall league
+        depth (int): number of top entries to crawl
+        output_folder (str): folder for the tables and checkpoint
+        gws (list, optional): gameweeks to fetch picks for, taken to be finished, defaults to every gameweek that has started
+        max_workers (int): maximum number of requests in flight at once
+        requests_per_second (float): request rate limit against the FPL api
+        batch_size (int): entries fetched between checkpoints
+    """
+    def __init__(self, league_id, depth, output_folder, gws=None, max_workers=8, requests_per_second=10, batch_size=100):
+        self.league_id = league_id
+        self.depth = depth
+        self.output_folder = output_folder
+        self.gws = gws
+        self.max_workers = max_workers
+        self.rate_limiter = RateLimiter(requests_per_second)
+        self.batch_size = batch_size
+        self.checkpoint_path = os.path.join(output_folder, 'crawl_checkpoint.json')
+        self.checkpoint = self.load_checkpoint()
+
+    def path(self, filename):
+        return os.path.join(self.output_folder, filename)
+
+    def load_checkpoint(self):
+        if os.path.exists(self.checkpoint_path):
+            with open(self.checkpoint_path) as f:
+                checkpoint = json.load(f)
+            if checkpoint['league_id'] != self.league_id:
+                raise Exception("Checkpoint in " + self.output_folder + " is for league " + str(checkpoint['league_id']))
+            # checkpoints from before picks were tracked per gameweek cannot say which gameweeks are stored
+            if 'picks' in checkpoint:
+                return checkpoint
+        return {'league_id': self.league_id, 'top': None, 'pages': [], 'last_page': None, 'picks': []}
+
+    def save_checkpoint(self):
+        # written to a temporary file first so an interruption never leaves a half written checkpoint
+        tmp_path = self.checkpoint_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.checkpoint, f)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def fetch(self, fetch, keys):
+        return fetch_concurrently(fetch, keys, self.max_workers, self.rate_limiter, FPL_HOST)
+
+    def fetch_page(self, page):
+        return get_league_standings(self.league_id, page)
+
+    def store_page(self, page, data):
+        standings = data['standings']
+        rows = [[m['rank'], m['entry'], m['player_name'], m['entry_name'], m['total']] for m in standings['results']]
+        append_rows(self.path('top_managers.csv'), MANAGER_HEADER, rows)
+        self.checkpoint['pages'] += [page]
+        if not standings['has_next'] and (self.checkpoint['last_page'] is None or page < self.checkpoint['last_page']):
+            self.checkpoint['last_page'] = page
+        self.save_checkpoint()
+
+    def check_standings(self):
+        """ Fetch the first standings page, and start the standings again if it has moved since the last run
+
+        Returns:
+            dict: the first page
+        """
+        (_, data), = self.fetch(self.fetch_page, [1])
+        top = [[m['entry'], m['total']] for m in data['standings']['results']]
+        if self.checkpoint['top'] is not None and self.checkpoint['top'] != top:
+            # points have been scored since the stored pages were fetched, so none of them can be trusted
+            if os.path.exists(self.path('top_managers.csv')):
+                os.remove(self.path('top_managers.csv'))
+            self.checkpoint['pages'] = []
+            self.checkpoint['last_page'] = None
+        self.checkpoint['top'] = top
+        self.save_checkpoint()
+        return data
+
+    def crawl_standings(self):
+        """ Fetch every standings page needed for the depth that is not already stored
+        """
+        first_page = self.check_standings()
+        pages = range(1, math.ceil(self.depth / PAGE_SIZE) + 1)
+        if 1 not in self.checkpoint['pages']:
+            self.store_page(1, first_page)
+        last_page = self.checkpoint['last_page']
+        todo = [page for page in pages if page not in self.checkpoint['pages'] and (last_page is None or page <= last_page)]
+        for page, data in self.fetch(self.fetch_page, todo):
+            self.store_page(page, data)
+
+    def get_entries(self):
+        """ Entry ids of the top `depth` entries, best first
+        """
+        managers = pd.read_csv(self.path('top_managers.csv')).drop_duplicates('entry')
+        return managers.sort_values('rank', kind='stable')['entry'].head(self.depth).tolist()
+
+    def fetch_picks(self, key):
+        """ Picks of an (entry, gw), None if the entry had no team that gameweek
+        """
+        try:
+            return get_entry_gw_picks(*key)
+        except Exception as e:
+            if str(e).endswith('404'):
+                return None
+            raise e
+
+    def crawl_picks(self):
+        """ Fetch picks for every (entry, gw) not already stored, checkpointing after each batch of entries
+
+        Gameweeks still being played are fetched again on every run and never marked complete.
+        """
+        if self.gws is None:
+            self.gws, live = get_played_gws()
+        else:
+            live = []
+        done = set(tuple(key) for key in self.checkpoint['picks'])
+        todo = {}
+        for entry in self.get_entries():
+            gws = [gw for gw in self.gws if (entry, gw) not in done]
+            if len(gws) > 0:
+                todo[entry] = gws
+        entries = list(todo)
+        for i in range(0, len(entries), self.batch_size):
+            keys = [(entry, gw) for entry in entries[i:i + self.batch_size] for gw in todo[entry]]
+            gw_rows = []
+            pick_rows = []
+            for (entry, gw), data in self.fetch(self.fetch_picks, keys):
+                if data is None:
+                    continue
+                history = data['entry_history']
+                gw_rows += [[entry, gw, history['points'], history['points_on_bench'], history['rank'], history['event_transfers'],
+                             history['event_transfers_cost'], history['total_points'], history['overall_rank'], int(history['value']) / 10,
+                             data['active_chip']]]
+                pick_rows += [[entry, gw, pick['element'], pick['position'], pick['multiplier']] for pick in data['picks']]
+            append_rows(self.path('top_managers_gwInfo.csv'), GW_INFO_HEADER, gw_rows)
+            append_rows(self.path('top_managers_gwPicks.csv'), PICKS_HEADER, pick_rows)
+            self.checkpoint['picks'] += [[int(entry), gw] for entry, gw in keys if gw not in live]
+            self.save_checkpoint()
+            print("Stored picks for " + str(min(i + self.batch_size, len(entries))) + " of " + str(len(entries)) + " entries")
+
+    def drop_duplicate_rows(self):
+        """ Keep only the latest row of every (entry, gw) in top_managers_gwInfo.csv and every pick in top_managers_gwPicks.csv
+
+        A batch interrupted before its checkpoint, or a gameweek still being played, is written again on the next run.
+        """
+        for filename, key in [('top_managers_gwInfo.csv', ['team_id', 'gw']), ('top_managers_gwPicks.csv', ['team_id', 'gw', 'position'])]:
+            path = self.path(filename)
+            if not os.path.exists(path):
+                continue
+            df = pd.read_csv(path)
+            if df.duplicated(key).any():
+                df = df.drop_duplicates(key, keep='last')
+                df.to_csv(path + '.tmp', index=False)
+                os.replace(path + '.tmp', path)
+
+    def crawl(self):
+        """ Run or resume the crawl, then write effective_ownership.csv
+        """
+        os.makedirs(self.output_folder, exist_ok=True)
+        if len(self.checkpoint['pages']) == 0:
+            # tables without a usable checkpoint are from an earlier crawl, start them again
+            for filename in ['top_managers.csv', 'top_managers_gwInfo.csv', 'top_managers_gwPicks.csv']:
+                if os.path.exists(self.path(filename)):
+                    os.remove(self.path(filename))
+        self.crawl_standings()
+        self.crawl_picks()
+        self.drop_duplicate_rows()
+        eo = effective_ownership(self.path('top_managers_gwPicks.csv'), self.get_entries())
+        eo.to_csv(self.path('effective_ownership.csv'), index=False)
+        return eo
+
+def effective_ownership(picks_path, entries=None):
+    """ Ownership and effective ownership of every picked player in every gameweek
+
+    Effective ownership counts each manager's multiplier, so a captain counts twice (three times with triple captain)
+    and a benched player not at all. Both are percentages of the managers with picks that gameweek.
+
+    Args:
+        picks_path (str): top_managers_gwPicks.csv written by LeagueCrawler
+        entries (list, optional): only count these entries
+
+    Returns:
+        DataFrame: 'gw', 'id', 'ownership', 'eo' and 'captaincy' columns
+    """
+    picks = pd.read_csv(picks_path, dtype={'team_id': 'int64', 'gw': 'int16', 'id': 'int32', 'position': 'int8', 'multiplier': 'int32'})
+    # a batch interrupted before its checkpoint is written again on resume
+    picks = picks.drop_duplicates(['team_id', 'gw', 'position'], keep='last')
+    if entries is not None:
+        picks = picks[picks['team_id'].isin(entries)]
+    managers = picks.groupby('gw')['team_id'].nunique()
+    picks = picks.assign(captain=picks['multiplier'] > 1)
+    eo = picks.groupby(['gw', 'id']).agg(owners=('team_id', 'size'), multiplier=('multiplier', 'sum'), captains=('captain', 'sum')).reset_index()
+    n = eo['gw'].map(managers)
+    eo['ownership'] = 100 * eo['owners'] / n
+    eo['eo'] = 100 * eo['multiplier'] / n
+    eo['captaincy'] = 100 * eo['captains'] / n
+    return eo.loc[:, ['gw', 'id', 'ownership', 'eo', 'captaincy']].sort_values(['gw', 'eo'], ascending=[True, False], ignore_index=True)
+
+def main():
+    # the original crawl: top 10 of the 2019/20 overall league, skipping the blank gameweeks 30-38
+    gameWeeks = [1,2,3,4,5,6,7,8,9,10,11,12,13,14,15,16,17,18,19,20,21,22,23,24,25,26,27,28,29,39,40,
+                 41,42,43,44,45,46,47]
+    crawler = LeagueCrawler(314, 10, 'data/2019-20/managers', gws=gameWeeks)
+    crawler.crawl()
+
+if __name__ == "__main__":
+    main()
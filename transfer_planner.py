@@ -0,0 +1,322 @@
+import time
+import numpy as np
+import pandas as pd
+from model_dataset_functions import TrailingWindow, FIXTURE_PARAMS, get_fixture_difficulties, read_gw_file
+from squad_optimiser import select_squad, SQUAD_QUOTAS, MAX_PER_TEAM, FORMATION_LIMITS, STARTERS
+from storage import read_table
+
+# plans transfers over a horizon of gameweeks with a beam search over squad states
+#   state: (squad, bank, free transfers, chips left), scored by points banked so far
+#   moves: keep the squad, make one or two transfers (extra transfers cost a hit), or play a chip
+#   each step keeps the `beam_width` states with the best points banked plus the squad's projected points over the rest of the horizon
+# lineup scores are memoised per (squad, gameweek, chip) so squads reached by different routes are only scored once
+
+HIT_COST = 4
+CHIPS = ['wildcard', 'bench_boost', 'triple_captain']
+
+def project_points(season, gw, horizon, lags = 19, difficulty_weight = 0.1):
+    """
+    Summary:
+        projected points for every player over gameweeks gw .. gw + horizon - 1
+        a player's base rate is their points per gameweek over the trailing window,
+        each fixture scores base rate x (1 + difficulty_weight x (3 - difficulty)), doubles score twice and blanks score nothing
+
+    Args:
+        season (str): season in 'YYYY-YY'
+        gw (int): first gameweek of the horizon
+        horizon (int): number of gameweeks
+        lags (int, optional): gameweeks in the trailing window. Defaults to 19.
+        difficulty_weight (float): change in points per step of fixture difficulty away from 3
+
+    Returns:
+        df: 'name', 'team', 'team_id', 'position', 'value' and one projected points column per gameweek
+    """
+    tables = TrailingWindow(lags).lagged_tables(season, gw)
+    trailing = pd.concat(tables, axis=0)
+    trailing['total_points'] = pd.to_numeric(trailing['total_points'], errors='coerce')
+
+    # position, team and value as of the most recent gameweek each player appears in
+    players = trailing.drop_duplicates('name', keep='first').loc[:, ['name', 'team', 'position', 'value']].reset_index(drop=True)
+    players['position'] = players['position'].replace('GKP', 'GK')
+    players['rate'] = players['name'].map(trailing.groupby('name')['total_points'].sum() / len(tables)).fillna(0)
+
+    teams = read_table(f'data/{season}/teams.csv', columns=['id', 'name'])
+    players['team_id'] = players['team'].map(dict(zip(teams['name'], teams['id'])))
+    players = players.dropna(subset=['team_id'])
+
+    gws = list(range(gw, gw + horizon))
+    fixs_df = read_table(f'data/{season}/fixtures.csv', columns=FIXTURE_PARAMS)
+    fixtures = get_fixture_difficulties(fixs_df, gws)
+    fixtures['factor'] = 1 + difficulty_weight * (3 - fixtures['difficulty'])
+    factors = fixtures.groupby(['team', 'event'])['factor'].sum().unstack('event').reindex(columns=gws).fillna(0)
+
+    team_factors = factors.reindex(players['team_id']).fillna(0).to_numpy()
+    for i, g in enumerate(gws):
+        players[g] = players['rate'].to_numpy() * team_factors[:, i]
+    return players.drop(columns=['rate']).reset_index(drop=True)
+
+def best_eleven(points, positions):
+    """
+    Summary:
+        boolean mask of the best starting eleven: each position's minimum is filled first,
+        then the best remaining players up to the position maximums
+    """
+    order = np.argsort(-points, kind='stable')
+    starter = np.zeros(len(points), dtype=bool)
+    counts = dict.fromkeys(FORMATION_LIMITS, 0)
+    for i in order:
+        if counts[positions[i]] < FORMATION_LIMITS[positions[i]][0]:
+            starter[i] = True
+            counts[positions[i]] += 1
+    for i in order:
+        if starter.sum() >= STARTERS:
+            break
+        if not starter[i] and counts[positions[i]] < FORMATION_LIMITS[positions[i]][1]:
+            starter[i] = True
+            counts[positions[i]] += 1
+    return starter
+
+def lineup_score(points, positions, chip = None):
+    """
+    Summary:
+        points of the best starting eleven from a squad, with the top starter as captain (points doubled)
+        bench_boost scores all fifteen, triple_captain triples the captain
+
+    Args:
+        points (array): projected points of the squad
+        positions (array): positions of the squad
+        chip (str, optional): chip played this gameweek
+
+    Returns:
+        float: projected points
+    """
+    starter = best_eleven(points, positions)
+    captain = points[starter].max()
+    if chip == 'bench_boost':
+        return points.sum() + captain
+    if chip == 'triple_captain':
+        return points[starter].sum() + 2 * captain
+    return points[starter].sum() + captain
+
+class State:
+    """
+    Summary:
+        a node of the search: the squad held after a gameweek's moves and the points banked to reach it
+    """
+    def __init__(self, squad, bank, free_transfers, chips, banked, moves):
+        self.squad = squad # sorted tuple of player rows
+        self.bank = bank
+        self.free_transfers = free_transfers
+        self.chips = chips # frozenset of chips still available
+        self.banked = banked
+        self.moves = moves # list of (transfers out, transfers in, hits, chip), one per gameweek planned
+
+    def key(self):
+        return (self.squad, self.bank, self.free_transfers, self.chips)
+
+class TransferPlanner:
+    """
+    Summary:
+        beam search over squad states for a multi-gameweek transfer plan
+
+    Args:
+        projections (df): output of project_points
+        gws (lst): the gameweek columns of projections to plan over, in order
+        beam_width (int): states kept after each gameweek
+        candidates_per_position (int): best players per position (by points over the rest of the horizon) considered as transfers in
+        moves_per_state (int): best single transfers from each state that are tried, alone and in pairs
+        max_free_transfers (int): free transfers that can be banked
+        hit_cost (int): points deducted for each transfer beyond the free ones
+    """
+    def __init__(self, projections, gws, beam_width = 30, candidates_per_position = 8, moves_per_state = 15, max_free_transfers = 2, hit_cost = HIT_COST):
+        self.players = projections.reset_index(drop=True)
+        self.gws = list(gws)
+        self.points = self.players[self.gws].to_numpy(dtype=float)
+        self.value = self.players['value'].to_numpy(dtype=int)
+        self.positions = self.players['position'].to_numpy()
+        self.teams = self.players['team_id'].to_numpy(dtype=int)
+        self.beam_width = beam_width
+        self.candidates_per_position = candidates_per_position
+        self.moves_per_state = moves_per_state
+        self.max_free_transfers = max_free_transfers
+        self.hit_cost = hit_cost
+        self.scores = {} # (squad, step or 'rest' marker, chip): memoised lineup scores
+        self.wildcards = {} # (step, budget): memoised wildcard squads
+        self.evaluated = 0
+
+    def score(self, squad, step, chip = None):
+        key = (squad, step, chip)
+        if key not in self.scores:
+            idx = list(squad)
+            self.scores[key] = lineup_score(self.points[idx, step], self.positions[idx], chip)
+        return self.scores[key]
+
+    def future(self, squad, step):
+        """ projected points of the squad over the gameweeks after step, from its lineup on summed projections
+        """
+        if step + 1 >= len(self.gws):
+            return 0
+        key = (squad, ('rest', step), None)
+        if key not in self.scores:
+            idx = list(squad)
+            self.scores[key] = lineup_score(self.points[idx, step + 1:].sum(axis=1), self.positions[idx])
+        return self.scores[key]
+
+    def single_moves(self, state, step):
+        """ best single transfers from a state, as (gain, out, in) sorted by points gained over the rest of the horizon
+        """
+        remaining = self.points[:, step:].sum(axis=1)
+        squad = np.array(state.squad)
+        in_squad = np.zeros(len(self.players), dtype=bool)
+        in_squad[squad] = True
+        team_counts = np.bincount(self.teams[squad], minlength=self.teams.max() + 1)
+        moves = []
+        for position in SQUAD_QUOTAS:
+            pool = np.where((self.positions == position) & ~in_squad)[0]
+            pool = pool[np.argsort(-remaining[pool], kind='stable')[:self.candidates_per_position]]
+            for out in squad[self.positions[squad] == position]:
+                for new in pool:
+                    if self.value[new] > state.bank + self.value[out]:
+                        continue
+                    if self.teams[new] != self.teams[out] and team_counts[self.teams[new]] >= MAX_PER_TEAM:
+                        continue
+                    moves += [(remaining[new] - remaining[out], out, new)]
+        moves.sort(key=lambda move: -move[0])
+        return moves[:self.moves_per_state]
+
+    def transfer_sets(self, state, step):
+        """ (outs, ins) transfer sets to try from a state: none, each good single transfer and valid pairs of them
+        """
+        singles = self.single_moves(state, step)
+        sets = [((), ())] + [((out,), (new,)) for _, out, new in singles]
+        for i, (_, out_a, new_a) in enumerate(singles):
+            for _, out_b, new_b in singles[i + 1:]:
+                if out_a == out_b or new_a == new_b:
+                    continue
+                cost = self.value[new_a] + self.value[new_b] - self.value[out_a] - self.value[out_b]
+                if cost > state.bank:
+                    continue
+                squad = [p for p in state.squad if p not in (out_a, out_b)] + [new_a, new_b]
+                if np.bincount(self.teams[squad]).max() > MAX_PER_TEAM:
+                    continue
+                sets += [((out_a, out_b), (new_a, new_b))]
+        return sets
+
+    def wildcard_squad(self, state, step):
+        """ best squad for the rest of the horizon within the state's total budget, memoised per (step, budget)
+        """
+        budget = state.bank + self.value[list(state.squad)].sum()
+        key = (step, budget)
+        if key not in self.wildcards:
+            players = self.players.loc[:, ['name', 'team_id', 'position', 'value']].rename(columns={'team_id': 'team'})
+            players['rest'] = self.points[:, step:].sum(axis=1)
+            players['row'] = np.arange(len(players))
+            squad = select_squad(players, points='rest', budget=budget)
+            self.wildcards[key] = tuple(sorted(squad['row']))
+        return self.wildcards[key]
+
+    def successors(self, state, step, chip_states):
+        """ states reachable from a state by this gameweek's moves
+        """
+        for outs, ins in self.transfer_sets(state, step):
+            squad = tuple(sorted([p for p in state.squad if p not in outs] + list(ins)))
+            bank = state.bank + int(self.value[list(outs)].sum() - self.value[list(ins)].sum())
+            hits = max(0, len(outs) - state.free_transfers)
+            free_transfers = min(self.max_free_transfers, max(1, state.free_transfers - len(outs) + 1))
+            chips = [None] + [chip for chip in ['bench_boost', 'triple_captain'] if chip in state.chips]
+            for chip in chips:
+                banked = state.banked + self.score(squad, step, chip) - self.hit_cost * hits
+                yield State(squad, bank, free_transfers, state.chips - {chip}, banked, state.moves + [(outs, ins, hits, chip)])
+
+        if 'wildcard' in state.chips and chip_states:
+            squad = self.wildcard_squad(state, step)
+            outs = tuple(p for p in state.squad if p not in squad)
+            ins = tuple(p for p in squad if p not in state.squad)
+            bank = state.bank + int(self.value[list(state.squad)].sum() - self.value[list(squad)].sum())
+            banked = state.banked + self.score(squad, step)
+            yield State(squad, bank, state.free_transfers, state.chips - {'wildcard'}, banked, state.moves + [(outs, ins, 0, 'wildcard')])
+
+    def plan(self, squad, bank = 0, free_transfers = 1, chips = ()):
+        """
+        Summary:
+            searches for the best sequence of moves over the horizon
+
+        Args:
+            squad (lst): player rows of projections in the current squad
+            bank (int): money in the bank, in the units of 'value'
+            free_transfers (int): free transfers available for the first gameweek
+            chips (iterable): chips still available, from CHIPS
+
+        Returns:
+            df: one row per gameweek with the transfers out and in, hits, chip, captain and projected points
+        """
+        beam = [State(tuple(sorted(squad)), bank, free_transfers, frozenset(chips), 0, [])]
+        for step in range(len(self.gws)):
+            best = {}
+            for rank, state in enumerate(beam):
+                # wildcards are only tried from the leading few states, each one needs an exact squad solve
+                for new_state in self.successors(state, step, rank < 3):
+                    self.evaluated += 1
+                    key = new_state.key()
+                    if key not in best or new_state.banked > best[key].banked:
+                        best[key] = new_state
+            ranked = sorted(best.values(), key=lambda s: -(s.banked + self.future(s.squad, step)))
+            beam = ranked[:self.beam_width]
+        return self.describe(squad, beam[0])
+
+    def describe(self, squad, state):
+        names = self.players['name']
+        rows = []
+        squad = tuple(sorted(squad))
+        for step, (outs, ins, hits, chip) in enumerate(state.moves):
+            squad = tuple(sorted([p for p in squad if p not in outs] + list(ins)))
+            idx = list(squad)
+            points = self.points[idx, step]
+            starter = best_eleven(points, self.positions[idx])
+            rows += [{
+                'gw': self.gws[step],
+                'out': list(names[list(outs)]),
+                'in': list(names[list(ins)]),
+                'hits': hits,
+                'chip': chip,
+                'captain': names[idx[int(np.argmax(np.where(starter, points, -np.inf)))]],
+                'points': self.score(squad, step, chip) - self.hit_cost * hits,
+                'squad': list(names[idx]),
+                'starters': list(names[np.array(idx)[starter]]),
+                }]
+        return pd.DataFrame(rows)
+
+def actual_points(season, plan, hit_cost = HIT_COST):
+    """
+    Summary:
+        points a plan's squads actually scored, playing each gameweek's projected eleven and captain
+    """
+    totals = []
+    for _, row in plan.iterrows():
+        gw_df = read_gw_file(season, row['gw'])
+        points = pd.to_numeric(gw_df['total_points'], errors='coerce').groupby(gw_df['name']).sum()
+        played = row['squad'] if row['chip'] == 'bench_boost' else row['starters']
+        captain = 2 if row['chip'] == 'triple_captain' else 1
+        total = points.reindex(played).fillna(0).sum() + captain * points.get(row['captain'], 0) - hit_cost * row['hits']
+        totals += [total]
+    return pd.Series(totals, index=plan['gw'])
+
+if __name__ == '__main__':
+    # benchmark: plan six gameweeks of 2023-24 from a squad picked on gameweek 10's projections
+    season, first_gw, horizon = '2023-24', 10, 6
+    start = time.time()
+    projections = project_points(season, first_gw, horizon)
+    print(f'projections for {len(projections)} players: {time.time() - start:.2f}s')
+
+    players = projections.loc[:, ['name', 'team_id', 'position', 'value', first_gw]].rename(columns={'team_id': 'team', first_gw: 'points'})
+    players['row'] = np.arange(len(players))
+    squad = select_squad(players, points='points')
+    bank = 1000 - int(squad['value'].sum())
+
+    gws = list(range(first_gw, first_gw + horizon))
+    planner = TransferPlanner(projections, gws)
+    start = time.time()
+    plan = planner.plan(list(squad['row']), bank=bank, chips=CHIPS)
+    print(f'planned {horizon} gameweeks in {time.time() - start:.2f}s, {planner.evaluated} states evaluated, {len(planner.scores)} lineups scored')
+    print(plan.drop(columns=['squad', 'starters']).to_string())
+    print(f"projected points: {plan['points'].sum():.1f}, actual points: {actual_points(season, plan).sum():.0f}")
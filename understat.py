@@ -1,67 +1,58 @@
-import requests
 import json
-from bs4 import BeautifulSoup
 import re
 import codecs
 import pandas as pd
 import os
-import csv
-
-def get_data(url):
-    response = requests.get(url)
-    if response.status_code != 200:
-        raise Exception("Response was code " + str(response.status_code))
-    html = response.text
-    parsed_html = BeautifulSoup(html, 'html.parser')
-    scripts = parsed_html.findAll('script')
-    filtered_scripts = []
-    for script in scripts:
-        if len(script.contents) > 0:
-            filtered_scripts += [script]
-    return scripts
+from fetcher import RateLimiter, fetch_concurrently
+from http_client import get_client
+from shot_store import build_shot_store
+from player_identity import load_fpl_players, load_overrides, resolve
+from storage import read_csv
+
+UNDERSTAT_HOST = 'understat.com'
+
+# understat embeds its data as `var name = JSON.parse('...')` in inline scripts,
+# the payload is hex-escaped so it never contains a bare quote
+SCRIPT_DATA = re.compile(rb"var\s+(\w+)\s*=\s*JSON\.parse\('(.*?)'\)")
+
+def extract_script_data(html, names=None):
+    """ Decode the JSON.parse payloads in a page straight from its raw bytes
+
+    Args:
+        html (bytes): page body
+        names (list, optional): variable names to keep, defaults to all
+
+    Returns:
+        dict: {variable name: decoded data}
+    """
+    data = {}
+    for match in SCRIPT_DATA.finditer(html):
+        name = match.group(1).decode('ascii')
+        if names is not None and name not in names:
+            continue
+        decoded_content = codecs.escape_decode(match.group(2))[0].decode('utf-8')
+        data[name] = json.loads(decoded_content)
+    return data
+
+def get_data(url, names=None):
+    response = get_client().get(url)
+    return extract_script_data(response.content, names)
 
 def get_epl_data():
-    scripts = get_data("https://understat.com/league/EPL/2024")
-    teamData = {}
-    playerData = {}
-    for script in scripts:
-        for c in script.contents:
-            split_data = c.split('=')
-            data = split_data[0].strip()
-            if data == 'var teamsData':
-                content = re.findall(r'JSON\.parse\(\'(.*)\'\)',split_data[1])
-                decoded_content = codecs.escape_decode(content[0], "hex")[0].decode('utf-8')
-                teamData = json.loads(decoded_content)
-            elif data == 'var playersData':
-                content = re.findall(r'JSON\.parse\(\'(.*)\'\)',split_data[1])
-                decoded_content = codecs.escape_decode(content[0], "hex")[0].decode('utf-8')
-                playerData = json.loads(decoded_content)
-    return teamData, playerData
+    data = get_data("https://understat.com/league/EPL/2024", ['teamsData', 'playersData'])
+    return data.get('teamsData', {}), data.get('playersData', {})
 
 def get_player_data(id):
-    scripts = get_data("https://understat.com/player/" + str(id))
-    groupsData = {}
-    matchesData = {}
-    shotsData = {}
-    for script in scripts:
-        for c in script.contents:
-            split_data = c.split('=')
-            data = split_data[0].strip()
-            if data == 'var matchesData':
-                content = re.findall(r'JSON\.parse\(\'(.*)\'\)',split_data[1])
-                decoded_content = codecs.escape_decode(content[0], "hex")[0].decode('utf-8')
-                matchesData = json.loads(decoded_content)
-            elif data == 'var shotsData':
-                content = re.findall(r'JSON\.parse\(\'(.*)\'\)',split_data[1])
-                decoded_content = codecs.escape_decode(content[0], "hex")[0].decode('utf-8')
-                shotsData = json.loads(decoded_content)
-            elif data == 'var groupsData':
-                content = re.findall(r'JSON\.parse\(\'(.*)\'\)',split_data[1])
-                decoded_content = codecs.escape_decode(content[0], "hex")[0].decode('utf-8')
-                groupsData = json.loads(decoded_content)
-    return matchesData, shotsData, groupsData
-
-def parse_epl_data(outfile_base):
+    data = get_data("https://understat.com/player/" + str(id), ['matchesData', 'shotsData', 'groupsData'])
+    return data.get('matchesData', {}), data.get('shotsData', {}), data.get('groupsData', {})
+
+def parse_epl_data(outfile_base, max_workers=8, requests_per_second=5):
+    """ Write the league tables, then every player's matches, shots and groups as their pages arrive
+
+    Player pages are fetched concurrently, rate limited on the understat host. Matches are
+    written to <outfile_base>/<player>_<id>.csv, shots and groups to the shots/ and groups/
+    folders under the same name, and the season's shot store is rebuilt from them at the end.
+    """
     teamData,playerData = get_epl_data()
     new_team_data = []
     for t,v in teamData.items():
@@ -72,12 +63,40 @@ def parse_epl_data(outfile_base):
         team_frame.to_csv(os.path.join(outfile_base, 'understat_' + team + '.csv'), index=False)
     player_frame = pd.DataFrame.from_records(playerData)
     player_frame.to_csv(os.path.join(outfile_base, 'understat_player.csv'), index=False)
-    for d in playerData:
-        matches, shots, groups = get_player_data(int(d['id']))
-        indi_player_frame = pd.DataFrame.from_records(matches)
-        player_name = d['player_name']
-        player_name = player_name.replace(' ', '_')
-        indi_player_frame.to_csv(os.path.join(outfile_base, player_name + '_' + d['id'] + '.csv'), index=False)
+
+    shots_base = os.path.join(outfile_base, 'shots')
+    groups_base = os.path.join(outfile_base, 'groups')
+    os.makedirs(shots_base, exist_ok=True)
+    os.makedirs(groups_base, exist_ok=True)
+    players = {d['id']: d['player_name'].replace(' ', '_') for d in playerData}
+    rate_limiter = RateLimiter(requests_per_second)
+    for id, (matches, shots, groups) in fetch_concurrently(get_player_data, players.keys(), max_workers, rate_limiter, UNDERSTAT_HOST):
+        filename = players[id] + '_' + id + '.csv'
+        pd.DataFrame.from_records(matches).to_csv(os.path.join(outfile_base, filename), index=False)
+        pd.DataFrame.from_records(shots).to_csv(os.path.join(shots_base, filename), index=False)
+        pd.DataFrame.from_records(flatten_groups(groups)).to_csv(os.path.join(groups_base, filename), index=False)
+    build_shot_store(outfile_base)
+
+def flatten_groups(groups):
+    """ groupsData as one record per row, tagged with its group
+
+    Groups are either lists of records or {season: {key: record}} dictionaries.
+    """
+    rows = []
+    for group, values in groups.items():
+        if isinstance(values, list):
+            rows += [dict(record, group=group) for record in values if isinstance(record, dict)]
+        elif isinstance(values, dict):
+            for season, entries in values.items():
+                if not isinstance(entries, dict):
+                    continue
+                for key, record in entries.items():
+                    if isinstance(record, dict):
+                        row = {'season': season, 'key': key}
+                        row.update(record)
+                        row['group'] = group
+                        rows += [row]
+    return rows
 
 class PlayerID:
     def __init__(self, us_id, fpl_id, us_name, fpl_name):
@@ -88,32 +107,26 @@ class PlayerID:
         
 
 def match_ids(understat_dir, data_dir):
-    with open(os.path.join(understat_dir, 'understat_player.csv')) as understat_file:
-        understat_inf = csv.DictReader(understat_file)
-        ustat_players = {}
-        for row in understat_inf:
-            ustat_players[row['player_name']] = row['id']
-
-    with open(os.path.join(data_dir, 'player_idlist.csv')) as fpl_file:
-        fpl_players = {}
-        fpl_inf = csv.DictReader(fpl_file)
-        for row in fpl_inf:
-            fpl_players[row['first_name'] + ' ' + row['second_name']] = row['id']
+    """ Write id_dict.csv pairing understat and FPL ids, see player_identity for how players are matched
+    """
+    fpl = load_fpl_players(data_dir)
+    understat = read_csv(os.path.join(understat_dir, 'understat_player.csv'), columns=['id', 'player_name', 'team_title', 'position'])
+    understat = understat.rename(columns={'player_name': 'name', 'team_title': 'team'})
+    matches = resolve(fpl, understat, load_overrides(data_dir, 'understat'))
+    fpl_ids = dict(zip(matches['id'], matches['fpl_id']))
+    fpl_names = dict(zip(fpl['id'], fpl['name']))
+
     players = []
-    found = {}
-    for k, v in ustat_players.items():
-        if k in fpl_players:
-            player = PlayerID(v, fpl_players[k], k, k)
-            players += [player]
-            found[k] = True
+    for us_id, us_name in zip(understat['id'], understat['name']):
+        if us_id in fpl_ids:
+            players += [PlayerID(us_id, fpl_ids[us_id], us_name, fpl_names[fpl_ids[us_id]])]
         else:
-            player = PlayerID(v, -1, k, "")
-            players += [player]
+            players += [PlayerID(us_id, -1, us_name, "")]
 
-    for k, v in fpl_players.items():
-        if k not in found:
-            player = PlayerID(-1, v, "", k)
-            players += [player]
+    found = set(fpl_ids.values())
+    for fpl_id, fpl_name in fpl_names.items():
+        if fpl_id not in found:
+            players += [PlayerID(-1, fpl_id, "", fpl_name)]
 
     with open(os.path.join(data_dir, 'id_dict.csv'), 'w+') as outf:
         outf.write('Understat_ID, FPL_ID, Understat_Name, FPL_Name\n')
@@ -0,0 +1,137 @@
+import os
+import numpy as np
+import pandas as pd
+from storage import read_table, parquet_path
+
+# scores players on model expected points and value for money, for every position and gameweek at once
+#   y_hat: expected points from the position's median coefficients
+#   points_gap: y_hat - actual trailing points
+#   PV / EPV: actual / expected points per unit of value
+#   incPV / incEPV: points above the base points per unit of value above the base value
+# base points are the low quantile of points among the cheapest players in the position that gameweek
+
+# minimum FPL prices by position, in the tenths of a million used by the value column
+BASE_VALUES = {'GK': 40, 'DEF': 40, 'MID': 45, 'FWD': 45}
+
+SCORE_COLUMNS = ['y_hat', 'points_gap', 'PV', 'incPV', 'EPV', 'incEPV']
+
+class ModelDataStore:
+    """
+    Summary:
+        keeps a season's model_data in memory, reloading it only when the file on disk changes
+        tr_rel (tr_total_points - tr_xP) and GK positions are prepared once per load rather than per call
+
+    Args:
+        season (str): season in 'YYYY-YY'
+    """
+    def __init__(self, season = '2024-25'):
+        self.csv_path = f'data/{season}/model_data.csv'
+        self.data = None
+        self.stamp = None
+
+    def file_stamp(self):
+        stamps = []
+        for path in [self.csv_path, parquet_path(self.csv_path)]:
+            if os.path.exists(path):
+                stamps += [os.path.getmtime(path)]
+        return tuple(stamps)
+
+    def get(self):
+        stamp = self.file_stamp()
+        if self.data is None or stamp != self.stamp:
+            data = read_table(self.csv_path, index_col=0)
+            data['position'] = data['position'].replace('GKP', 'GK')
+            data['tr_rel'] = data['tr_total_points'] - data['tr_xP']
+            self.data = data
+            self.stamp = stamp
+        return self.data
+
+def median_coefficients(model_df):
+    """
+    Summary:
+        median coefficient of each regressor across seasons, from a generate_params_df frame
+    """
+    return model_df.loc['Coefficients'].median(axis=1)
+
+def score_players(data, coeffs_dic, y = 'tr_total_points', gws = None, minute_filter = 70, base_values = BASE_VALUES, base_quantile = 0.1):
+    """
+    Summary:
+        scores every player in data for the positions in coeffs_dic in one vectorised pass
+
+    Args:
+        data (df): model data, as held by ModelDataStore
+        coeffs_dic (dic): {position: coefficients Series}, a 'const' entry is used as the intercept
+        y (str): actual points column the expected points are compared against
+        gws (lst, optional): gw labels ('YYYY-YY-N') to score, defaults to all
+        minute_filter (int): to exclude players with trailing ave mpg at or below given threshold
+        base_values (dic): {position: base value}, positions missing from it use the cheapest value that gameweek
+        base_quantile (float): quantile of the cheapest players' points used as the base points
+
+    Returns:
+        df: name, team, position, gw, tr_minutes, value, y, the score columns and the regressors
+    """
+    positions = list(coeffs_dic.keys())
+    coeffs = pd.DataFrame(coeffs_dic).T.fillna(0)
+    regressors = [col for col in coeffs.columns if col != 'const']
+
+    df = data[data['position'].isin(positions) & (data['tr_minutes'] > minute_filter)]
+    if gws != None:
+        df = df[df['gw'].isin(gws)]
+    df = df.loc[:, ['name', 'team', 'position', 'gw', 'tr_minutes', 'value', y] + [col for col in regressors if col != y]]
+
+    # each row picks up its own position's coefficients
+    row_coeffs = coeffs.loc[df['position']].to_numpy()
+    x = df[regressors].fillna(0).to_numpy(dtype = float)
+    y_hat = (x * row_coeffs[:, [coeffs.columns.get_loc(col) for col in regressors]]).sum(axis=1)
+    if 'const' in coeffs.columns:
+        y_hat = y_hat + row_coeffs[:, coeffs.columns.get_loc('const')]
+    df['y_hat'] = y_hat
+    df['points_gap'] = df['y_hat'] - df[y]
+
+    group = [df['gw'], df['position']]
+    cheapest = df['value'] == df.groupby(group)['value'].transform('min')
+    base_pts = df[cheapest].groupby(['gw', 'position'])[y].quantile(base_quantile)
+    base_pts = pd.Series(base_pts.reindex(pd.MultiIndex.from_arrays(group)).to_numpy(), index = df.index)
+    base_val = df['position'].map(base_values).fillna(df.groupby(group)['value'].transform('min'))
+
+    df['PV'] = df[y] / df['value']
+    df['incPV'] = (df[y] - base_pts) / (df['value'] - base_val)
+    df['EPV'] = df['y_hat'] / df['value']
+    df['incEPV'] = (df['y_hat'] - base_pts) / (df['value'] - base_val)
+    df = df.replace([np.inf, -np.inf], np.nan)
+
+    return df.loc[:, ['name', 'team', 'position', 'gw', 'tr_minutes', 'value', y] + SCORE_COLUMNS + [col for col in regressors if col != y]]
+
+class PlayerValuer:
+    """
+    Summary:
+        scoring API over the latest model data: holds the data in memory and the median coefficients per position
+
+    Args:
+        model_dfs (dic): {position: generate_params_df frame}
+        season (str): season whose model_data is scored
+        y (str): actual points column the expected points are compared against
+    """
+    def __init__(self, model_dfs, season = '2024-25', y = 'tr_total_points'):
+        self.store = ModelDataStore(season)
+        self.coeffs_dic = {position: median_coefficients(model_df) for position, model_df in model_dfs.items()}
+        self.y = y
+
+    def value(self, gws = None, positions = None, minute_filter = 70, base_values = BASE_VALUES):
+        """
+        Summary:
+            scores the given gameweeks and positions, defaulting to every gameweek and every modelled position
+        """
+        coeffs_dic = self.coeffs_dic
+        if positions != None:
+            coeffs_dic = {position: coeffs_dic[position] for position in positions}
+        return score_players(self.store.get(), coeffs_dic, self.y, gws, minute_filter, base_values)
+
+    def latest(self, **kwargs):
+        """
+        Summary:
+            scores only the most recent gameweek in the model data
+        """
+        data = self.store.get()
+        gw_number = data['gw'].str.split('-').str[-1].astype(int).to_numpy()
+        return self.value(gws = [data['gw'].iloc[gw_number.argmax()]], **kwargs)